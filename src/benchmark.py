@@ -0,0 +1,375 @@
+#!/usr/bin/env python3
+
+import os
+import tempfile
+import time
+import tracemalloc
+from lib import cache, incremental, interpreter, lexer, parser, prefetch
+from lib.interpreter import generate_ast, load_ast, load_source, run
+
+
+def synthetic_script(lines):
+    chunk = [
+        'var total = 0',
+        'for i = 0 to 100 step 2:',
+        '\tvar total = total + i * 3 // 2 - (i % 7) ^ 2',
+        'end',
+        '@ line comment',
+        'func scale(value, factor = 1.5) -> value * factor',
+        'if total >= 10 and not total == 12: print("big") else: print("small")',
+        'var names = ["ada", "bob", "cy"]; var ages = {"ada": 36, "bob": 41}',
+    ]
+    return '\n'.join(chunk[i % len(chunk)] for i in range(lines)) + '\n'
+
+
+def best_of(repeat, func):
+    best = None
+    for _ in range(repeat):
+        start = time.perf_counter()
+        func()
+        elapsed = time.perf_counter() - start
+        best = elapsed if best is None else min(best, elapsed)
+    return best
+
+
+def bench_lexer(text, repeat):
+    print("Lexing {} bytes".format(len(text)))
+    for mode in lexer.LEXER_MODES:
+        elapsed = best_of(repeat, lambda: lexer.Lexer('<bench>', text, mode).make_tokens())
+        print("  {:<8} {:8.3f}s".format(mode, elapsed))
+
+
+def bench_tokens(text, repeat):
+    print("Token memory and throughput")
+    for mode in lexer.LEXER_MODES:
+        tracemalloc.start()
+        tokens, _ = lexer.Lexer('<bench>', text, mode).make_tokens()
+        size, _ = tracemalloc.get_traced_memory()
+        tracemalloc.stop()
+
+        elapsed = best_of(repeat, lambda: lexer.Lexer('<bench>', text, mode).make_tokens())
+        print("  {:<8} {:8d} tokens {:7.1f} bytes/token {:10.0f} tokens/s".format(
+            mode, len(tokens), size / len(tokens), len(tokens) / elapsed))
+
+
+def bench_parser(text, repeat):
+    tokens, _ = lexer.Lexer('<bench>', text).make_tokens()
+    elapsed = best_of(repeat, lambda: parser.Parser(tokens).parse())
+    print("Parsing {} tokens".format(len(tokens)))
+    print("  {:<8} {:8.3f}s".format("parse", elapsed))
+
+
+def bench_ast(text):
+    tracemalloc.start()
+    ast = parser.Parser(lexer.Lexer('<bench>', text).generate_tokens()).parse().node
+    size, _ = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    lines = text.count('\n')
+    print("AST for {} lines".format(lines))
+    print("  {:<8} {:8.1f} MB {:7.0f} bytes/line".format("resident", size / 1e6, size / lines))
+
+
+def stress_scripts(scale):
+    # Inputs that made the backtracking statement parser re-parse the same
+    # tokens: a failed 'return' expression used to be re-read as call
+    # arguments at every nesting level, doubling the work per level
+    yield "nested return", 'return (if a: ' * (scale // 500) + 'return (1 +'
+    yield "bad block tail", 'while a:\n' + 'var x = (1 + 2) * 3\n' * scale + 'var y = (1 +\nend\n'
+    yield "many returns", 'func f() {\n' + 'return (1 + 2) * 3\n' * scale + '}\n'
+    yield "returns no expr", 'func f() {\n' + 'return\n' * scale + '}\n'
+
+
+def bench_stress(repeat):
+    print("Parsing pathological inputs")
+    for scale in (5000, 10000, 20000):
+        for name, text in stress_scripts(scale):
+            tokens, _ = lexer.Lexer('<bench>', text).make_tokens()
+            elapsed = best_of(repeat, lambda: parser.Parser(tokens).parse())
+            print("  {:<16} {:8d} tokens {:8.3f}s {:6.2f} us/token".format(
+                name, len(tokens), elapsed, elapsed / len(tokens) * 1e6))
+
+
+def nesting_scripts(depth):
+    yield "parentheses", '(' * depth + '1' + ')' * depth
+    yield "lists", '[' * depth + ']' * depth
+    yield "if blocks", 'if a:\n' * depth + '1\n' + 'end\n' * depth
+
+
+def bench_nesting(repeat):
+    print("Parsing deeply nested inputs")
+    for depth in (1000, 5000, 20000):
+        for name, text in nesting_scripts(depth):
+            tokens, _ = lexer.Lexer('<bench>', text).make_tokens()
+            elapsed = best_of(repeat, lambda: parser.Parser(tokens).parse())
+            print("  {:<16} {:8d} levels {:8.3f}s".format(name, depth, elapsed))
+
+def dict_literal(keys, repeats):
+    # Config-style literal where every key appears `repeats` times
+    entries = ('"key{}": {}'.format(i % keys, i) for i in range(keys * repeats))
+    return '{' + ', '.join(entries) + '}\n'
+
+
+def bench_dict(repeat):
+    print("Dictionary literals")
+    for keys in (10000, 100000):
+        for repeats in (1, 2):
+            text = dict_literal(keys, repeats)
+            tokens, _ = lexer.Lexer('<bench>', text).make_tokens()
+            parse = best_of(repeat, lambda: parser.Parser(tokens).parse())
+            total = best_of(repeat, lambda: run('<bench>', text))
+            print("  {:8d} keys x{} {:8.3f}s parse {:8.3f}s run".format(keys, repeats, parse, total))
+
+def bench_mapped(text, repeat):
+    print("Lexing from a file")
+    with tempfile.NamedTemporaryFile('w', suffix='.kode', delete=False) as f:
+        f.write(text)
+    try:
+        def read():
+            with open(f.name) as source:
+                return source.read()
+
+        for name, load in (("read", read), ("binary", lambda: load_source(f.name))):
+            # Stream the tokens so the peak is dominated by the source itself
+            tracemalloc.start()
+            for _ in lexer.Lexer(f.name, load()).generate_tokens(): pass
+            _, peak = tracemalloc.get_traced_memory()
+            tracemalloc.stop()
+
+            elapsed = best_of(repeat, lambda: lexer.Lexer(f.name, load()).make_tokens())
+            print("  {:<8} {:8.3f}s {:8.1f} MB peak".format(name, elapsed, peak / 1e6))
+    finally:
+        os.remove(f.name)
+
+
+def bench_cache(text, repeat):
+    print("Loading a parsed file")
+    with tempfile.TemporaryDirectory() as directory:
+        fn = os.path.join(directory, 'bench.kode')
+        with open(fn, 'w') as f:
+            f.write(text)
+        source = load_source(fn)
+
+        def load():
+            # Leave out the in-process copy to time the on-disk entry
+            cache.loaded.clear()
+            load_ast(fn, source)
+
+        load()
+        for name, func in (("parse", lambda: generate_ast(fn, source)), ("cache", load)):
+            elapsed = best_of(repeat, func)
+            print("  {:<8} {:8.3f}s".format(name, elapsed))
+        print("  {:<8} {:8.1f} MB".format("entry", os.path.getsize(cache.cache_path(fn)) / 1e6))
+
+
+def bench_reparse(text, repeat):
+    print("Parsing an edited file")
+    fn = '<bench>'
+    edited = text.replace('var total = 0\n', 'var total = 1\n', 1)
+    starts = []
+    node, _ = generate_ast(fn, text, starts)
+    document = incremental.Document(node, text, starts)
+
+    reparse = lambda: incremental.reparse(fn, document, edited)
+    for name, func in (("parse", lambda: generate_ast(fn, edited)), ("reparse", reparse)):
+        elapsed = best_of(repeat, func)
+        print("  {:<8} {:8.3f}s".format(name, elapsed))
+
+
+def bench_modules(text, repeat):
+    print("Parsing a program of {} modules".format(os.cpu_count()))
+    with tempfile.TemporaryDirectory() as directory:
+        names = [os.path.join(directory, 'module{}.kode'.format(i)) for i in range(os.cpu_count())]
+        for name in names:
+            with open(name, 'w') as f:
+                f.write(text)
+        main = ''.join('importAs("{}", "m{}")\n'.format(name, i) for i, name in enumerate(names))
+        node, _ = generate_ast('<bench>', main)
+
+        def clear():
+            # Entries may live under KODECACHEPREFIX rather than next to the
+            # modules
+            for name in names:
+                try:
+                    os.remove(cache.cache_path(name))
+                except FileNotFoundError:
+                    pass
+
+        def cold(load):
+            def func():
+                clear()
+                cache.loaded.clear()
+                incremental.documents.clear()
+                load()
+            return func
+
+        def serial():
+            for name in names:
+                load_ast(name, load_source(name))
+
+        try:
+            elapsed = best_of(repeat, cold(serial))
+            print("  {:<8} {:8.3f}s".format("serial", elapsed))
+
+            # prefetch_imports does nothing on a single core
+            if (os.cpu_count() or 1) < 2:
+                print("  pool skipped (1 core)")
+            else:
+                elapsed = best_of(repeat, cold(lambda: prefetch.prefetch_imports(node)))
+                print("  {:<8} {:8.3f}s".format("pool", elapsed))
+        finally:
+            clear()
+
+
+def loop_script(iterations):
+    return '\n'.join([
+        'var total = 0',
+        'for i = 0 to {}:'.format(iterations),
+        '\tvar total = total + i * 3 // 2 - (i % 7) ^ 2',
+        'end',
+        'func fib(n) {',
+        '\tif n < 2: return n',
+        '\treturn fib(n - 1) + fib(n - 2)',
+        '}',
+        # A value other than a Number just before a call
+        'var name = "fi" + "b"',
+        'var f = fib(15)',
+        'var k = 0',
+        'while k < {}:'.format(iterations),
+        '\tvar k = k + 1',
+        'end',
+    ]) + '\n'
+
+
+def bench_engines(repeat):
+    print("Running loops and arithmetic")
+    text = loop_script(50000)
+
+    def execute(engine):
+        # Functions cannot be defined twice in one global scope
+        interpreter.global_symbol_table = interpreter.reset_global_symbol_table()
+        _, error = run('<bench>', text, engine=engine)
+        assert error is None, error.as_string()
+
+    for engine in interpreter.ENGINES:
+        elapsed = best_of(repeat, lambda: execute(engine))
+        print("  {:<8} {:8.3f}s".format(engine, elapsed))
+
+
+def tail_script(depth):
+    return '\n'.join([
+        'func count(n, acc) -> if n == 0: acc else: count(n - 1, acc + 1)',
+        'func count_down(n, acc) {',
+        '\tif n == 0: return acc',
+        '\treturn count_down(n - 1, acc + n)',
+        '}',
+        'var a = count({}, 0)'.format(depth),
+        'var b = count_down({}, 0)'.format(depth),
+    ]) + '\n'
+
+
+def bench_tail_calls(repeat):
+    # Far deeper than the Python stack allows without tail calls
+    print("Running tail recursion")
+    text = tail_script(20000)
+
+    def execute(engine):
+        interpreter.global_symbol_table = interpreter.reset_global_symbol_table()
+        _, error = run('<bench>', text, engine=engine)
+        assert error is None, error.as_string()
+
+    for engine in interpreter.ENGINES:
+        elapsed = best_of(repeat, lambda: execute(engine))
+        print("  {:<8} {:8.3f}s".format(engine, elapsed))
+
+
+def counted_script(iterations):
+    return '\n'.join([
+        'for i = 0 to {}: 0'.format(iterations),
+        'func f(n) {',
+        '\tvar total = 0',
+        '\tfor i = 0 to n step 2:',
+        '\t\tvar total = total + i',
+        '\tend',
+        '\treturn total',
+        '}',
+        'var t = f({})'.format(iterations),
+    ]) + '\n'
+
+
+def bench_for_loops(repeat):
+    print("Running counted for loops, per iteration")
+    iterations = 100000
+    text = counted_script(iterations)
+
+    def execute(engine):
+        interpreter.global_symbol_table = interpreter.reset_global_symbol_table()
+        _, error = run('<bench>', text, engine=engine)
+        assert error is None, error.as_string()
+
+    for engine in interpreter.ENGINES:
+        elapsed = best_of(repeat, lambda: execute(engine))
+        print("  {:<8} {:8.0f}ns".format(engine, elapsed / (iterations * 1.5) * 1e9))
+
+
+def sum_script(size):
+    return '\n'.join([
+        'var numbers = range(0, {})'.format(size),
+        'var total = 0',
+        'for n in numbers:',
+        '\tvar total = total + n',
+        'end',
+        'func add(a, b) -> a + b',
+        'for i = 0 to {}:'.format(size),
+        '\tvar total = add(total, numbers / i)',
+        'end',
+    ]) + '\n'
+
+
+def bench_allocations():
+    print("Values allocated per loop iteration")
+    count = [0]
+
+    def counting_new(cls, *args):
+        count[0] += 1
+        return object.__new__(cls)
+
+    # Counters up to 1000 stay among the shared small integers
+    for size in (1000, 10000):
+        text = sum_script(size)
+        for engine in interpreter.ENGINES:
+            interpreter.global_symbol_table = interpreter.reset_global_symbol_table()
+            count[0] = 0
+            # Every value is built through Value.__new__
+            interpreter.Value.__new__ = counting_new
+            try:
+                _, error = run('<bench>', text, engine=engine)
+            finally:
+                del interpreter.Value.__new__
+            assert error is None, error.as_string()
+            print("  {:<8} {:6d} {:8.2f}".format(engine, size, count[0] / (2 * size)))
+
+
+if __name__ == "__main__":
+    import argparse
+
+    arg_parser = argparse.ArgumentParser()
+    arg_parser.add_argument("--lines", type=int, default=20000)
+    arg_parser.add_argument("--repeat", type=int, default=3)
+
+    argument = arg_parser.parse_args()
+    text = synthetic_script(argument.lines)
+    bench_lexer(text, argument.repeat)
+    bench_tokens(text, argument.repeat)
+    bench_parser(text, argument.repeat)
+    bench_ast(text)
+    bench_stress(argument.repeat)
+    bench_nesting(argument.repeat)
+    bench_dict(argument.repeat)
+    bench_mapped(text, argument.repeat)
+    bench_cache(text, argument.repeat)
+    bench_reparse(text, argument.repeat)
+    bench_modules(text, argument.repeat)
+    bench_engines(argument.repeat)
+    bench_tail_calls(argument.repeat)
+    bench_for_loops(argument.repeat)
+    bench_allocations()
@@ -1,10 +1,11 @@
 #!/usr/bin/env python3
 
-from lib.interpreter import run
+from lib import interpreter
+from lib.interpreter import DEFAULT_ENGINE, ENGINES, run_file
 
 
-def run_kode_file(filepath):
-    _ret, _exc = run('<stdin>', 'run("{}")'.format(filepath))
+def run_kode_file(filepath, engine=DEFAULT_ENGINE):
+    _ret, _exc = run_file(filepath, engine)
 
 
 if __name__ == "__main__":
@@ -12,6 +13,10 @@ if __name__ == "__main__":
 
     parser = argparse.ArgumentParser()
     action = parser.add_argument(dest="file")
+    parser.add_argument("--engine", choices=sorted(ENGINES), default=DEFAULT_ENGINE)
+    # Deep recursion needs the vm engine, which keeps calls off the Python stack
+    parser.add_argument("--max-call-depth", type=int, default=interpreter.max_call_depth)
 
     argument, _ = parser.parse_known_args()
-    run_kode_file(filepath=argument.file)
+    interpreter.max_call_depth = argument.max_call_depth
+    run_kode_file(filepath=argument.file, engine=argument.engine)
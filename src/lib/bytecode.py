@@ -0,0 +1,266 @@
+from lib.utils import nodes, token
+
+#######################################
+# OPCODES
+#######################################
+
+# Instructions are pairs of ints in one flat list: the opcode and its
+# argument, which is a constant index, a count or a jump target. Code.nodes
+# holds, for each instruction, the node it was compiled from: errors take
+# their positions from it. The loads keep their inline caches, lists the
+# virtual machine updates, in their constant
+
+OP_NUMBER			= 0		# constant index: push a Number
+OP_STRING			= 1		# constant index: push a String
+OP_LOAD				= 2		# constant index of (name, lookup cache)
+OP_LOAD_MODULE		= 3		# constant index of (module name, name, module cache)
+OP_STORE			= 4		# constant index of the name, keeps the value
+OP_BINARY			= 5		# index in BINARY_OPERATORS
+OP_UNARY			= 6		# UNARY_MINUS, UNARY_NOT or 0 for '+'
+OP_BUILD_LIST		= 7		# element count
+OP_BUILD_DICT		= 8		# entry count, each one a value then its key
+OP_EVAL				= 9		# constant index of a Code, run for its value only
+OP_EVAL_CHECKED		= 10	# the same, but its errors are reported
+OP_JUMP				= 11	# target
+OP_JUMP_IF_FALSE	= 12	# target
+OP_POP				= 13
+OP_NULL				= 14
+OP_FOR_PREP			= 15	# constant index of (name, has step, variable unseen)
+OP_FOR_ITER			= 16	# loop exit
+OP_FOREACH_PREP		= 17	# constant index of the name
+OP_FOREACH_ITER		= 18	# loop exit
+OP_WHILE_PREP		= 19
+OP_SETUP_LOOP		= 20	# constant index of (loop exit, body start)
+OP_POP_BLOCK		= 21
+OP_LOOP_APPEND		= 22
+OP_LOOP_END			= 23	# 1 when the loop gives null
+OP_CHECK_FUNCTION	= 24	# constant index of the name
+OP_MAKE_FUNCTION	= 25	# constant index of the FunctionDefNode
+OP_OPTIONAL_NAMES	= 26	# argument count
+OP_CHECK_ARGUMENT	= 27	# constant index of (name, values pushed before it)
+OP_CALL				= 28	# constant index of (argument count, optional names, tail call)
+OP_RETURN			= 29
+OP_BREAK			= 30
+OP_CONTINUE			= 31
+OP_END				= 32
+
+BINARY_OPERATORS = [
+	token.T_PLUS, token.T_MINUS, token.T_MUL, token.T_DIV, token.T_INT_DIV,
+	token.T_REMAINDER, token.T_POW, token.T_EE, token.T_NE, token.T_LT,
+	token.T_GT, token.T_LTE, token.T_GTE, 'and', 'or',
+]
+BINARY_INDEXES = {op: i for i, op in enumerate(BINARY_OPERATORS)}
+
+UNARY_MINUS	= 1
+UNARY_NOT	= 2
+UNARY_OPERATORS = {token.T_MINUS: UNARY_MINUS, 'not': UNARY_NOT}
+
+#######################################
+# CODE
+#######################################
+
+class Code:
+	__slots__ = ('instructions', 'constants', 'nodes', 'spans')
+
+	def __init__(self):
+		self.instructions = []
+		self.constants = []
+		self.nodes = []
+		self.spans = None
+
+	def emit(self, op, arg, node):
+		# Gives the instruction's offset, to patch jumps with
+		self.instructions.append(op)
+		self.instructions.append(arg)
+		self.nodes.append(node)
+		return len(self.instructions) - 2
+
+	def patch(self, offset, target):
+		self.instructions[offset + 1] = target
+
+	def here(self):
+		return len(self.instructions)
+
+	def constant(self, value):
+		self.constants.append(value)
+		return len(self.constants) - 1
+
+	def positions(self):
+		# The line table: the start and end of each instruction's node
+		if self.spans is None:
+			self.spans = [(node.pos_start, node.pos_end) for node in self.nodes]
+		return self.spans
+
+#######################################
+# COMPILER
+#######################################
+
+# Every expression leaves exactly one value on the stack. Loops keep their
+# state under the values of their body; break and continue are resolved when
+# they run, against the innermost loop running in the same Code, so they also
+# reach loops in the code that called a function
+
+def compile_code(node):
+	code = Code()
+	compile_node(code, node)
+	code.emit(OP_END, 0, node)
+	return code
+
+def compile_node(code, node):
+	method = COMPILE_METHODS.get(type(node))
+	if method is None:
+		raise Exception(f'No compile_{type(node).__name__} method defined')
+	method(code, node)
+
+def compile_NumberNode(code, node):
+	code.emit(OP_NUMBER, code.constant(node.value), node)
+
+def compile_StringNode(code, node):
+	code.emit(OP_STRING, code.constant(node.value), node)
+
+def compile_ListNode(code, node):
+	for element_node in node.element_nodes:
+		compile_node(code, element_node)
+	code.emit(OP_BUILD_LIST, len(node.element_nodes), node)
+
+def compile_DictNode(code, node):
+	# A failing value is stored as nothing, as the tree interpreter does
+	for key, value in node.element_nodes.items():
+		code.emit(OP_EVAL, code.constant(compile_code(value)), value)
+		compile_node(code, key)
+	code.emit(OP_BUILD_DICT, len(node.element_nodes), node)
+
+def compile_VarAccessNode(code, node):
+	if node.module_name:
+		code.emit(OP_LOAD_MODULE, code.constant((node.module_name, node.var_name, [])), node)
+	else:
+		code.emit(OP_LOAD, code.constant((node.var_name, [-1])), node)
+
+def compile_VarAssignNode(code, node):
+	compile_node(code, node.value_node)
+	code.emit(OP_STORE, code.constant(node.var_name), node)
+
+def compile_BinOpNode(code, node):
+	compile_node(code, node.left_node)
+	compile_node(code, node.right_node)
+	code.emit(OP_BINARY, BINARY_INDEXES[node.op], node)
+
+def compile_UnaryOpNode(code, node):
+	compile_node(code, node.node)
+	code.emit(OP_UNARY, UNARY_OPERATORS.get(node.op, 0), node)
+
+def compile_IfNode(code, node):
+	end_jumps = []
+
+	for condition, expr, should_return_null in node.cases:
+		compile_node(code, condition)
+		next_case = code.emit(OP_JUMP_IF_FALSE, 0, condition)
+		compile_expression(code, expr, should_return_null)
+		end_jumps.append(code.emit(OP_JUMP, 0, node))
+		code.patch(next_case, code.here())
+
+	if node.else_case:
+		expr, should_return_null = node.else_case
+		compile_expression(code, expr, should_return_null)
+	else:
+		code.emit(OP_NULL, 0, node)
+
+	for end_jump in end_jumps:
+		code.patch(end_jump, code.here())
+
+def compile_expression(code, node, should_return_null):
+	compile_node(code, node)
+	if should_return_null:
+		code.emit(OP_POP, 0, node)
+		code.emit(OP_NULL, 0, node)
+
+def compile_loop(code, node, iterate, body_node):
+	# iterate emits the jump out of the loop at its start and gives its offset
+	block = code.constant(None)
+	code.emit(OP_SETUP_LOOP, block, node)
+	start = code.here()
+	exit_jump = iterate()
+	body = code.here()
+	compile_node(code, body_node)
+	# The body's values are only collected for a loop that gives them
+	code.emit(OP_POP if node.should_return_null else OP_LOOP_APPEND, 0, node)
+	code.emit(OP_JUMP, start, node)
+
+	code.constants[block] = (code.here(), body)
+	if exit_jump is not None: code.patch(exit_jump, code.here())
+	code.emit(OP_POP_BLOCK, 0, node)
+	code.emit(OP_LOOP_END, int(bool(node.should_return_null)), node)
+
+def compile_ForNode(code, node):
+	compile_node(code, node.start_value_node)
+	compile_node(code, node.end_value_node)
+	if node.step_value_node:
+		compile_node(code, node.step_value_node)
+	code.emit(OP_FOR_PREP, code.constant((node.var_name, bool(node.step_value_node), nodes.loop_variable_unseen(node))), node)
+	compile_loop(code, node, lambda: code.emit(OP_FOR_ITER, 0, node), node.body_node)
+
+def compile_ForEachNode(code, node):
+	# Only errors stop the loop before it starts
+	code.emit(OP_EVAL_CHECKED, code.constant(compile_code(node.array)), node.array)
+	code.emit(OP_FOREACH_PREP, code.constant(node.var_name), node)
+	compile_loop(code, node, lambda: code.emit(OP_FOREACH_ITER, 0, node), node.body_node)
+
+def compile_WhileNode(code, node):
+	def iterate():
+		compile_node(code, node.condition_node)
+		return code.emit(OP_JUMP_IF_FALSE, 0, node.condition_node)
+
+	code.emit(OP_WHILE_PREP, 0, node)
+	compile_loop(code, node, iterate, node.body_node)
+
+def compile_FunctionDefNode(code, node):
+	# The body is compiled when the function is first called
+	code.emit(OP_CHECK_FUNCTION, code.constant(node.var_name), node)
+	for value in node.optional_arg_values:
+		code.emit(OP_EVAL_CHECKED, code.constant(compile_code(value)), value)
+	code.emit(OP_MAKE_FUNCTION, code.constant(node), node)
+
+def compile_CallNode(code, node):
+	compile_node(code, node.node_to_call)
+	for arg_node in node.arg_nodes:
+		compile_node(code, arg_node)
+
+	code.emit(OP_OPTIONAL_NAMES, len(node.arg_nodes), node)
+	for i, (name, value) in enumerate(zip(node.optional_arg_names, node.optional_arg_values)):
+		code.emit(OP_CHECK_ARGUMENT, code.constant((name, i)), node)
+		code.emit(OP_EVAL, code.constant(compile_code(value)), value)
+
+	code.emit(OP_CALL, code.constant((len(node.arg_nodes), list(node.optional_arg_names), hasattr(node, '_tail'))), node)
+
+def compile_ReturnNode(code, node):
+	if node.node_to_return:
+		compile_node(code, node.node_to_return)
+	else:
+		code.emit(OP_NULL, 0, node)
+	code.emit(OP_RETURN, 0, node)
+
+def compile_ContinueNode(code, node):
+	code.emit(OP_CONTINUE, 0, node)
+
+def compile_BreakNode(code, node):
+	code.emit(OP_BREAK, 0, node)
+
+COMPILE_METHODS = {
+	nodes.NumberNode:		compile_NumberNode,
+	nodes.StringNode:		compile_StringNode,
+	nodes.ListNode:			compile_ListNode,
+	nodes.DictNode:			compile_DictNode,
+	nodes.VarAccessNode:	compile_VarAccessNode,
+	nodes.VarAssignNode:	compile_VarAssignNode,
+	nodes.BinOpNode:		compile_BinOpNode,
+	nodes.UnaryOpNode:		compile_UnaryOpNode,
+	nodes.IfNode:			compile_IfNode,
+	nodes.ForNode:			compile_ForNode,
+	nodes.ForEachNode:		compile_ForEachNode,
+	nodes.WhileNode:		compile_WhileNode,
+	nodes.FunctionDefNode:	compile_FunctionDefNode,
+	nodes.CallNode:			compile_CallNode,
+	nodes.ReturnNode:		compile_ReturnNode,
+	nodes.ContinueNode:		compile_ContinueNode,
+	nodes.BreakNode:		compile_BreakNode,
+}
@@ -0,0 +1,175 @@
+from lib.utils import nodes, position
+import gc
+import hashlib
+import marshal
+import os
+import struct
+import tempfile
+
+#######################################
+# AST CACHE
+#######################################
+
+# Parsed files are stored in __kodecache__/<name>.kodec next to the source,
+# or under KODECACHEPREFIX when it is set. An entry is only used when both the
+# content hash and CACHE_VERSION match. Bump CACHE_VERSION whenever the lexer,
+# the parser or the node layout changes what a file parses to
+CACHE_VERSION	= 3
+CACHE_MAGIC		= b'KODEC'
+CACHE_DIR		= '__kodecache__'
+CACHE_SUFFIX	= '.kodec'
+
+enabled = True
+
+NODE_TYPES = [
+	nodes.NumberNode,
+	nodes.StringNode,
+	nodes.ListNode,
+	nodes.DictNode,
+	nodes.VarAccessNode,
+	nodes.VarAssignNode,
+	nodes.BinOpNode,
+	nodes.UnaryOpNode,
+	nodes.IfNode,
+	nodes.ForNode,
+	nodes.ForEachNode,
+	nodes.WhileNode,
+	nodes.FunctionDefNode,
+	nodes.CallNode,
+	nodes.ReturnNode,
+	nodes.BreakNode,
+	nodes.ContinueNode,
+]
+NODE_IDS = {node_type: i for i, node_type in enumerate(NODE_TYPES)}
+
+# The last tree loaded or stored by this process for each path, with its digest
+loaded = {}
+
+def source_digest(text):
+	if isinstance(text, str):
+		text = text.encode('utf-8')
+	return hashlib.sha256(text).digest()
+
+def entry_header(digest):
+	return CACHE_MAGIC + struct.pack('<I', CACHE_VERSION) + digest
+
+def cache_path(fn):
+	prefix = os.environ.get('KODECACHEPREFIX')
+	if prefix:
+		# One flat directory for every source: name entries by their full path
+		name = hashlib.sha256(os.path.abspath(fn).encode('utf-8')).hexdigest()[:32]
+		return os.path.join(prefix, name + CACHE_SUFFIX)
+
+	head, tail = os.path.split(fn)
+	return os.path.join(head, CACHE_DIR, os.path.splitext(tail)[0] + CACHE_SUFFIX)
+
+def load(fn, digest, text):
+	if not enabled: return None
+
+	entry = loaded.get(os.path.abspath(fn))
+	if entry and entry[0] == digest: return entry[1]
+
+	try:
+		with open(cache_path(fn), 'rb') as f:
+			data = f.read()
+	except OSError:
+		return None
+
+	# Stale entries are told apart by their header alone
+	header = entry_header(digest)
+	if not data.startswith(header): return None
+
+	try:
+		node = load_body(data[len(header):], fn, text)
+	except Exception:
+		# A damaged entry is only a cache miss
+		return None
+
+	loaded[os.path.abspath(fn)] = (digest, node)
+	return node
+
+def load_body(body, fn, text):
+	# The tree holds no cycles, so collections while it is built only cost time
+	gc_enabled = gc.isenabled()
+	gc.disable()
+	try:
+		return decode(marshal.loads(body), position.make_source(fn, text))
+	finally:
+		if gc_enabled: gc.enable()
+
+def store(fn, digest, node):
+	if not enabled: return
+
+	loaded[os.path.abspath(fn)] = (digest, node)
+
+	try:
+		body = marshal.dumps(encode(node))
+	except (ValueError, RecursionError):
+		# Too deeply nested for marshal; parse it again next time
+		return
+
+	write_entry(fn, digest, body)
+
+def write_entry(fn, digest, body):
+	data = entry_header(digest) + body
+	path = cache_path(fn)
+	cache_dir = os.path.dirname(path) or '.'
+
+	# Write to a temporary file and move it into place, so readers only ever
+	# see a complete entry even with several processes writing at once
+	try:
+		os.makedirs(cache_dir, exist_ok=True)
+		fd, tmp_path = tempfile.mkstemp(dir=cache_dir, suffix='.tmp')
+		try:
+			with os.fdopen(fd, 'wb') as f:
+				f.write(data)
+			os.replace(tmp_path, path)
+		except OSError:
+			os.remove(tmp_path)
+			raise
+	except OSError:
+		pass
+
+#######################################
+# ENCODING
+#######################################
+
+# Trees are marshalled as plain tuples and lists. A node becomes
+# (T_NODE, type id, start, end, *fields); tuples and dicts inside nodes are
+# tagged as well, everything else is stored as is
+
+T_NODE	= 0
+T_TUPLE	= 1
+T_DICT	= 2
+
+def encode(value):
+	if isinstance(value, nodes.Node):
+		node_type = type(value)
+		fields = tuple(encode(getattr(value, name)) for name in node_type.__slots__)
+		return (T_NODE, NODE_IDS[node_type], value.start, value.end) + fields
+	if isinstance(value, list):
+		return [encode(item) for item in value]
+	if isinstance(value, tuple):
+		return (T_TUPLE,) + tuple(encode(item) for item in value)
+	if isinstance(value, dict):
+		return (T_DICT, [encode(key) for key in value], [encode(item) for item in value.values()])
+	return value
+
+def decode(value, src):
+	if type(value) is tuple:
+		tag = value[0]
+		if tag == T_NODE:
+			node_type = NODE_TYPES[value[1]]
+			node = node_type.__new__(node_type)
+			node.start = value[2]
+			node.end = value[3]
+			node.src = src
+			for name, item in zip(node_type.__slots__, value[4:]):
+				setattr(node, name, decode(item, src))
+			return node
+		if tag == T_TUPLE:
+			return tuple(decode(item, src) for item in value[1:])
+		return {decode(key, src): decode(item, src) for key, item in zip(value[1], value[2])}
+	if type(value) is list:
+		return [decode(item, src) for item in value]
+	return value
@@ -13,7 +13,7 @@ class Error:
 	def as_string(self):
 		result  = f'{self.error_name}: {self.details}\n'
 		result += f'File {self.pos_start.fn}, line {self.pos_start.ln + 1}'
-		result += '\n\n' + swa.string_with_arrows(self.pos_start.ftxt, self.pos_start, self.pos_end)
+		result += '\n\n' + swa.string_with_arrows(self.pos_start.src, self.pos_start, self.pos_end)
 		return result
 
 class IllegalCharError(Error):
@@ -32,20 +32,22 @@ class RTError(Error):
 	def as_string(self):
 		result  = self.generate_traceback()
 		result += f'{self.error_name}: {self.details}'
-		result += '\n\n' + swa.string_with_arrows(self.pos_start.ftxt, self.pos_start, self.pos_end)
+		result += '\n\n' + swa.string_with_arrows(self.pos_start.src, self.pos_start, self.pos_end)
 		return result
 
 	def generate_traceback(self):
-		result = ''
+		# Lines are gathered innermost first and joined once: deep recursion
+		# can give a long chain of contexts
+		lines = []
 		pos = self.pos_start
 		ctx = self.context
 
 		while ctx:
-			result = f'  File {pos.fn}, line {str(pos.ln + 1)}, in {ctx.display_name}\n' + result
+			lines.append(f'  File {pos.fn}, line {str(pos.ln + 1)}, in {ctx.display_name}\n')
 			pos = ctx.parent_entry_pos
 			ctx = ctx.parent
 
-		return 'Traceback (most recent call last):\n' + result
+		return 'Traceback (most recent call last):\n' + ''.join(reversed(lines))
 
 class ExpectedCharError(Error):
 	def __init__(self, pos_start, pos_end, details):
@@ -0,0 +1,103 @@
+from lib.utils import nodes, token
+from lib import lexer, parser
+
+#######################################
+# DOCUMENT
+#######################################
+
+# A new version of a file is reparsed from its last Document: top-level
+# statements whose text is unchanged at the start and at the end of the file
+# are kept as they are, same objects, and only the statements between them are
+# lexed and parsed again
+
+NEWLINES = ('\n', b'\n')
+
+# The last document parsed for each path
+documents = {}
+
+class Document:
+	def __init__(self, node, text, statement_starts):
+		# statement_starts holds the offset of each top-level statement's first
+		# token, as recorded by the parser
+		self.node = node
+		self.length = len(text)
+		self.binary = not isinstance(text, str)
+		self.statement_starts = statement_starts
+
+		# Statement i owns the text from its start to the start of the next one,
+		# the new lines that end it included. The first one also owns anything
+		# before it, and the last one anything after it
+		self.bounds = [0] + statement_starts[1:] + [len(text)]
+		self.hashes = [hash(text[start:end]) for start, end in zip(self.bounds, self.bounds[1:])]
+
+	def span_matches(self, i, text, delta=0):
+		start = self.bounds[i] + delta
+		end = self.bounds[i + 1] + delta
+		return end <= len(text) and hash(text[start:end]) == self.hashes[i]
+
+def reparse(fn, document, text):
+	# Gives a Document for text, or None when the edit cannot be parsed on its
+	# own and the whole file has to be parsed again
+	statements = document.node.element_nodes
+	count = len(statements)
+	delta = len(text) - document.length
+	if count == 0 or document.binary != (not isinstance(text, str)): return None
+
+	# The last statement reads up to the end of the file, so it is only kept
+	# at the start when nothing follows it
+	first = 0
+	while first < count and (first < count - 1 or delta == 0) and document.span_matches(first, text):
+		first += 1
+	if first == count:
+		statements[0].src.update(text)
+		return document
+
+	last = count
+	while last > first and document.bounds[last - 1] + delta >= document.bounds[first] \
+		and document.span_matches(last - 1, text, delta):
+		last -= 1
+
+	# Parse the text in between as if the file ended there. Unless it ends with
+	# a new line, its last token or comment could run on into the next
+	# statement, so that statement is parsed again as well
+	region_start = document.bounds[first]
+	region_end = document.bounds[last] + delta
+	while last < count and region_end > region_start and text[region_end - 1:region_end] not in NEWLINES:
+		last += 1
+		region_end = document.bounds[last] + delta
+	lex = lexer.Lexer(fn, text, lexer.LEXER_TABLE)
+	region_starts = []
+	pars = parser.Parser(lex.generate_tokens(region_start, region_end), region_starts)
+	first_tok = pars.current_tok
+	res = pars.parse_region()
+	if lex.error or res.error: return None
+
+	region = res.node
+	if first + len(region) + count - last == 0: return None
+
+	# The file starts and ends where its first and last tokens do
+	if first > 0: start = document.node.start
+	elif first_tok.type != token.T_EOF: start = first_tok.pos_start.idx
+	elif last > 0: start = document.statement_starts[last] + delta
+	else: start = document.node.start + delta
+	end = pars.current_tok.pos_end.idx if last == count else document.node.end + delta
+
+	# Only now that the edit parsed, move the kept statements to the new text
+	src = statements[0].src
+	src.update(text)
+	for statement in region:
+		for node in nodes.walk(statement):
+			node.relocate(0, src)
+	if delta:
+		for statement in statements[last:]:
+			for node in nodes.walk(statement):
+				node.relocate(delta, src)
+
+	node = nodes.ListNode(
+		statements[:first] + region + statements[last:],
+		start, end, src
+	)
+	statement_starts = document.statement_starts
+	return Document(node, text,
+		statement_starts[:first] + region_starts + [start + delta for start in statement_starts[last:]]
+	)
@@ -4,7 +4,9 @@ import sys
 sys.path.insert(1, '/lib/modules/ciao/')
 
 from lib.modules.ciao.app import *
-from lib import errors, lexer, parser
+from lib import bytecode, cache, errors, incremental, lexer, parser, prefetch
+from lib.lexer import load_source
+import operator
 import os
 
 #######################################
@@ -12,6 +14,13 @@ import os
 #######################################
 
 class RTResult:
+	# Flags are off unless set, so a result can also be built by setting value
+	value = None
+	error = None
+	func_return_value = None
+	loop_should_continue = False
+	loop_should_break = False
+
 	def __init__(self):
 		self.reset()
 
@@ -69,20 +78,17 @@ class RTResult:
 # VALUES
 #######################################
 
-class Value:
-	def __init__(self):
-		self.set_pos()
-		self.set_context()
-
-	def set_pos(self, pos_start=None, pos_end=None):
-		self.pos_start = pos_start
-		self.pos_end = pos_end
-		return self
+# Values carry no positions or context. An operation that fails gives an
+# OperationError, which the interpreter places on the nodes of its operands in
+# the context it runs in
 
-	def set_context(self, context=None):
-		self.context = context
-		return self
+class OperationError:
+	def __init__(self, details, on_right=False):
+		self.details = details
+		# Whether it concerns the right operand alone rather than both
+		self.on_right = on_right
 
+class Value:
 	def added_to(self, other):
 		return None, self.illegal_operation(other)
 
@@ -141,16 +147,10 @@ class Value:
 		return False
 
 	def illegal_operation(self, other=None):
-		if not other: other = self
-		return errors.RTError(
-			self.pos_start, other.pos_end,
-			'Illegal operation',
-			self.context
-		)
+		return OperationError('Illegal operation')
 
 class List(Value):
 	def __init__(self, elements):
-		super().__init__()
 		self.elements = elements
 
 	def dived_by(self, other):
@@ -158,164 +158,149 @@ class List(Value):
 			try:
 				return self.elements[other.value], None
 			except:
-				return None, errors.RTError(
-					other.pos_start, other.pos_end,
+				return None, OperationError(
 					"Element at this index could not be retrieved form the list because the index is out of bounds",
-					self.context
+					on_right=True
 				)
 		else:
 			return None, Value.illegal_operation(self, other)
 
 	def copy(self):
-		copy = List(self.elements)
-		copy.set_context(self.context)
-		copy.set_pos(self.pos_start, self.pos_end)
-		return copy
+		return List(self.elements)
 
 	def __repr__(self):
 		return f'[{", ".join([str(x) for x in self.elements])}]'
 
 class Dict(Value):
 	def __init__(self, elements):
-		super().__init__()
 		self.elements = elements
 
 	def copy(self):
-		copy = Dict(self.elements)
-		copy.set_context(self.context)
-		copy.set_pos(self.pos_start, self.pos_end)
-		return copy
+		return Dict(self.elements)
 
 	def __repr__(self):
 		return str(self.elements)
 
 class Number(Value):
 	def __init__(self, value):
-		super().__init__()
 		self.value = value
 
 	def added_to(self, other):
 		if isinstance(other, Number):
-			return Number(self.value + other.value).set_context(self.context), None
+			return new_number(self.value + other.value), None
 		else:
 			return None, Value.illegal_operation(self, other)
 
 	def subbed_by(self, other):
 		if isinstance(other, Number):
-			return Number(self.value - other.value).set_context(self.context), None
+			return new_number(self.value - other.value), None
 		else:
 			return None, Value.illegal_operation(self, other)
 
 	def multed_by(self, other):
 		if isinstance(other, Number):
-			return Number(self.value * other.value).set_context(self.context), None
+			return new_number(self.value * other.value), None
 		else:
 			return None, Value.illegal_operation(self, other)
 
 	def dived_by(self, other):
 		if isinstance(other, Number):
 			if other.value == 0:
-				return None, errors.RTError(
-					other.pos_start, other.pos_end,
-					'Division by zero',
-					self.context
-				)
+				return None, OperationError('Division by zero', on_right=True)
 
-			return Number(self.value / other.value).set_context(self.context), None
+			return new_number(self.value / other.value), None
 		else:
 			return None, Value.illegal_operation(self, other)
 
 	def int_dived_by(self, other):
 		if isinstance(other, Number):
 			if other.value == 0:
-				return None, errors.RTError(
-					other.pos_start, other.pos_end,
-					'Division by zero',
-					self.context
-				)
+				return None, OperationError('Division by zero', on_right=True)
 
-			return Number(self.value // other.value).set_context(self.context), None
+			return new_number(self.value // other.value), None
 		else:
 			return None, Value.illegal_operation(self, other)
 
 	def remainder_of(self, other):
 		if isinstance(other, Number):
 			if other.value == 0:
-				return None, errors.RTError(
-					other.pos_start, other.pos_end,
-					'Division by zero',
-					self.context
-				)
+				return None, OperationError('Division by zero', on_right=True)
 
-			return Number(self.value % other.value).set_context(self.context), None
+			return new_number(self.value % other.value), None
 		else:
 			return None, Value.illegal_operation(self, other)
 
 	def powed_by(self, other):
 		if isinstance(other, Number):
-			return Number(self.value ** other.value).set_context(self.context), None
+			return new_number(self.value ** other.value), None
 		else:
 			return None, Value.illegal_operation(self, other)
 
 	def get_comparison_eq(self, other):
 		if isinstance(other, Number):
-			return Number(int(self.value == other.value)).set_context(self.context), None
+			return new_number(int(self.value == other.value)), None
 		else:
 			return None, Value.illegal_operation(self, other)
 
 	def get_comparison_ne(self, other):
 		if isinstance(other, Number):
-			return Number(int(self.value != other.value)).set_context(self.context), None
+			return new_number(int(self.value != other.value)), None
 		else:
 			return None, Value.illegal_operation(self, other)
 
 	def get_comparison_lt(self, other):
 		if isinstance(other, Number):
-			return Number(int(self.value < other.value)).set_context(self.context), None
+			return new_number(int(self.value < other.value)), None
 		else:
 			return None, Value.illegal_operation(self, other)
 
 	def get_comparison_gt(self, other):
 		if isinstance(other, Number):
-			return Number(int(self.value > other.value)).set_context(self.context), None
+			return new_number(int(self.value > other.value)), None
 		else:
 			return None, Value.illegal_operation(self, other)
 
 	def get_comparison_lte(self, other):
 		if isinstance(other, Number):
-			return Number(int(self.value <= other.value)).set_context(self.context), None
+			return new_number(int(self.value <= other.value)), None
 		else:
 			return None, Value.illegal_operation(self, other)
 
 	def get_comparison_gte(self, other):
 		if isinstance(other, Number):
-			return Number(int(self.value >= other.value)).set_context(self.context), None
+			return new_number(int(self.value >= other.value)), None
 		else:
 			return None, Value.illegal_operation(self, other)
 
 	def anded_by(self, other):
 		if isinstance(other, Number):
-			return Number(int(self.value and other.value)).set_context(self.context), None
+			return new_number(int(self.value and other.value)), None
 		else:
 			return None, Value.illegal_operation(self, other)
 
 	def ored_by(self, other):
 		if isinstance(other, Number):
-			return Number(int(self.value or other.value)).set_context(self.context), None
+			return new_number(int(self.value or other.value)), None
 		else:
 			return None, Value.illegal_operation(self, other)
 
 	def notted(self):
-		return Number(1 if self.value == 0 else 0).set_context(self.context), None
+		return new_number(1 if self.value == 0 else 0), None
 
 	def copy(self):
-		copy = Number(self.value)
-		copy.set_pos(self.pos_start, self.pos_end)
-		copy.set_context(self.context)
-		return copy
+		return new_number(self.value)
 
 	def is_true(self):
 		return self.value != 0
+
+	# Numbers key dictionaries by their value, as strings do by their contents
+	def __eq__(self, other):
+		if isinstance(other, Number):
+			return self.value == other.value
+		return NotImplemented
+
+	def __hash__(self):
+		return hash(self.value)
 	
 	def __repr__(self):
 		return str(self.value)
@@ -324,31 +309,52 @@ Number.null = Number(0)
 Number.false = Number(0)
 Number.true = Number(1)
 
+# Numbers are never changed once built and compare by value, so the small
+# integers that counters, indexes and comparisons give are built once and
+# shared. Other numbers are built directly, without the constructor call
+SMALL_INT_MIN = -5
+SMALL_INT_MAX = 1024
+small_ints = []
+
+def new_number(value):
+	if type(value) is int and SMALL_INT_MIN <= value <= SMALL_INT_MAX:
+		return small_ints[value - SMALL_INT_MIN]
+	number = Number.__new__(Number)
+	number.value = value
+	return number
+
+small_ints.extend(Number(i) for i in range(SMALL_INT_MIN, SMALL_INT_MAX + 1))
+
 class String(Value):
 	def __init__(self, value):
-		super().__init__()
 		self.value = value
 
 	def added_to(self, other):
 		if isinstance(other, String):
-			return String(self.value + other.value).set_context(self.context), None
+			return String(self.value + other.value), None
 		else:
 			return None, Value.illegal_operation(self, other)
 
 	def multed_by(self, other):
 		if isinstance(other, Number):
-			return String(self.value * other.value).set_context(self.context), None
+			return String(self.value * other.value), None
 		else:
 			return None, Value.illegal_operation(self, other)
 
 	def is_true(self):
 		return len(self.value) > 0
 
+	# Strings key dictionaries by their contents
+	def __eq__(self, other):
+		if isinstance(other, String):
+			return self.value == other.value
+		return NotImplemented
+
+	def __hash__(self):
+		return hash(self.value)
+
 	def copy(self):
-		copy = String(self.value)
-		copy.set_pos(self.pos_start, self.pos_end)
-		copy.set_context(self.context)
-		return copy
+		return String(self.value)
 
 	def __str__(self):
 		return self.value
@@ -357,29 +363,36 @@ class String(Value):
 		return f'"{self.value}"'
 
 class BaseFunction(Value):
+	# The slot of each local name, when the body was resolved by the compiler
+	layout = None
+
 	def __init__(self, name):
-		super().__init__()
 		self.name = name or "<anonymous>"
 
-	def generate_new_context(self):
-		new_context = Context(self.name, self.context, self.pos_start)
-		new_context.symbol_table = SymbolTable(new_context.parent.symbol_table)
+	def generate_new_context(self, context, node):
+		# Functions are not copied to be called: the context and node of the
+		# call are given to execute and kept on the new context instead
+		new_context = Context(self.name, context, node.pos_start, node.pos_end)
+		if self.layout is None:
+			new_context.symbol_table = SymbolTable(context.symbol_table)
+		else:
+			new_context.symbol_table = Frame(self.layout, context.symbol_table)
 		return new_context
 
-	def check_args(self, arg_names, args):
+	def check_args(self, arg_names, args, exec_ctx):
 		res = RTResult()
 		if len(args) > len(arg_names):
 			return res.failure(errors.RTError(
-				self.pos_start, self.pos_end,
+				exec_ctx.parent_entry_pos, exec_ctx.parent_entry_end,
 				f"{len(args) - len(arg_names)} too many args passed into '{self.name}'",
-				self.context
+				exec_ctx.parent
 			))
 		
 		if len(args) < len(arg_names):
 			return res.failure(errors.RTError(
-				self.pos_start, self.pos_end,
+				exec_ctx.parent_entry_pos, exec_ctx.parent_entry_end,
 				f"{len(arg_names) - len(args)} too few args passed into '{self.name}'",
-				self.context
+				exec_ctx.parent
 			))
 		
 		return res.success(None)
@@ -388,26 +401,24 @@ class BaseFunction(Value):
 		for i in range(len(args)):
 			arg_name = arg_names[i]
 			arg_value = args[i]
-			arg_value.set_context(exec_ctx)
 			exec_ctx.symbol_table.set(arg_name, arg_value)
 
 		for i in range(len(optional_arg_values)):
 			arg_name = optional_arg_names[i]
 			arg_value = optional_arg_values[i]
-			arg_value.set_context(exec_ctx)
 			exec_ctx.symbol_table.set(arg_name, arg_value)
 
 	def check_and_populate_args(self, arg_names, optional_arg_names, optional_arg_values, args, exec_ctx):
 		res = RTResult()
 
-		res.register(self.check_args(arg_names, args))
+		res.register(self.check_args(arg_names, args, exec_ctx))
 		if res.should_return(): return res
 		self.populate_args(arg_names, args, optional_arg_names, optional_arg_values, exec_ctx)
 
 		return res.success(None)
 
 class Function(BaseFunction):
-	def __init__(self, name, body_node, arg_names, optional_arg_names, optional_arg_values, should_auto_return, module):
+	def __init__(self, name, body_node, arg_names, optional_arg_names, optional_arg_values, should_auto_return, module, interpreter=None, layout=None):
 		super().__init__(name)
 		self.body_node = body_node
 		self.arg_names = arg_names
@@ -415,11 +426,23 @@ class Function(BaseFunction):
 		self.optional_arg_values = optional_arg_values
 		self.should_auto_return = should_auto_return
 		self.module = module
-
-	def execute(self, args, optional_arg_names, optional_arg_values):
-		res = RTResult()
-		interpreter = Interpreter()
-		exec_ctx = self.generate_new_context()
+		# The engine that defined the function also runs its body
+		self.interpreter = interpreter or Interpreter()
+		self.layout = layout
+
+	def start(self, args, optional_arg_names, optional_arg_values, context, node, tail=False):
+		# Sets up a call to run the body in: gives its context, and a failed
+		# result when the call cannot start. A tail call takes the place of the
+		# call that made it, at the same depth
+		exec_ctx = self.generate_new_context(context, node)
+		if tail: exec_ctx.depth = context.depth
+
+		if exec_ctx.depth > max_call_depth:
+			return exec_ctx, RTResult().failure(errors.RTError(
+				node.pos_start, node.pos_end,
+				f"Maximum call depth of {max_call_depth} exceeded",
+				context
+			))
 
 		for i in range(len(optional_arg_names)):
 			for j in range(len(self.optional_arg_names)):
@@ -427,33 +450,112 @@ class Function(BaseFunction):
 					self.optional_arg_values[j] = optional_arg_values[i]
 					break
 
-		res.register(self.check_and_populate_args(self.arg_names, self.optional_arg_names, self.optional_arg_values, args, exec_ctx))
-		if res.should_return(): return res
+		res = self.check_and_populate_args(self.arg_names, self.optional_arg_names, self.optional_arg_values, args, exec_ctx)
+		return exec_ctx, (res if res.should_return() else None)
+
+	def finish(self, res):
+		# The result of the call, from that of its body
+		if res.should_return() and res.func_return_value is None: return res
+
+		ret_value = (res.value if self.should_auto_return else None) or res.func_return_value or Number.null
+		return RTResult().success(ret_value)
+
+	def execute(self, args, optional_arg_names, optional_arg_values, context, node):
+		# A call in tail position gives back a TailCall instead of running: it is
+		# run here, in place of the function that made it, so tail recursion
+		# does not grow the Python stack
+		function = self
+		tail = False
+
+		while True:
+			exec_ctx, res = function.start(args, optional_arg_names, optional_arg_values, context, node, tail)
+			if res: return res
+
+			try:
+				res = function.finish(function.interpreter.visit(function.body_node, exec_ctx))
+			except RecursionError:
+				# The engines other than the virtual machine call functions on the
+				# Python stack, which can run out before max_call_depth is reached
+				return RTResult().failure(errors.RTError(
+					node.pos_start, node.pos_end,
+					"Maximum recursion depth exceeded",
+					context
+				))
 
-		value = res.register(interpreter.visit(self.body_node, exec_ctx))
-		if res.should_return() and res.func_return_value == None: return res
+			tail_call = res.value
+			if type(tail_call) is not TailCall: return res
 
-		ret_value = (value if self.should_auto_return else None) or res.func_return_value or Number.null
-		return res.success(ret_value)
+			function = tail_call.function
+			args = tail_call.args
+			optional_arg_names = tail_call.optional_arg_names
+			optional_arg_values = tail_call.optional_arg_values
+			context = tail_call.context
+			node = tail_call.node
+			tail = True
 
 	def copy(self):
-		copy = Function(self.name, self.body_node, self.arg_names, self.optional_arg_names, self.optional_arg_values, self.should_auto_return, self.module)
-		copy.set_context(self.context)
-		copy.set_pos(self.pos_start, self.pos_end)
-		return copy
+		return Function(self.name, self.body_node, self.arg_names, self.optional_arg_names, self.optional_arg_values, self.should_auto_return, self.module, self.interpreter, self.layout)
 
 	def __repr__(self):
 		return f"<function {self.name}>"
 
+class TailCall:
+	# A call to a Function, evaluated but not run, that the calling function
+	# gives as its value
+	__slots__ = ('function', 'args', 'optional_arg_names', 'optional_arg_values', 'context', 'node')
+
+	def __init__(self, function, args, optional_arg_names, optional_arg_values, context, node):
+		self.function = function
+		self.args = args
+		self.optional_arg_names = optional_arg_names
+		self.optional_arg_values = optional_arg_values
+		self.context = context
+		self.node = node
+
+# The parts of these nodes that do not pass a return on are not searched for
+# tail calls: dict values, the optional values of calls and definitions and
+# the array of a for each
+TAIL_CALL_LEAVES = (nodes.FunctionDefNode, nodes.DictNode, nodes.CallNode, nodes.ForEachNode)
+
+def mark_tail_calls(node):
+	# Sets _tail on the calls whose value a FunctionDefNode's body gives as
+	# the function's: the value of a return that reaches the function and, for
+	# a function returning its body's value, the calls that value comes from.
+	# The definition itself is marked once it has been searched
+	if hasattr(node, '_tail'): return
+	node._tail = True
+
+	pending = [node.body_node]
+	while pending:
+		for child in nodes.walk(pending.pop(), TAIL_CALL_LEAVES):
+			if isinstance(child, nodes.ReturnNode) and isinstance(child.node_to_return, nodes.CallNode):
+				child.node_to_return._tail = True
+			elif isinstance(child, nodes.CallNode):
+				pending.append(child.node_to_call)
+				pending.extend(child.arg_nodes)
+			elif isinstance(child, nodes.ForEachNode):
+				pending.append(child.body_node)
+
+	if not node.should_auto_return: return
+	pending = [node.body_node]
+	while pending:
+		child = pending.pop()
+		if isinstance(child, nodes.CallNode):
+			child._tail = True
+		elif isinstance(child, nodes.IfNode):
+			pending.extend(expr for _, expr, should_return_null in child.cases if not should_return_null)
+			if child.else_case and not child.else_case[1]:
+				pending.append(child.else_case[0])
+
 class BuiltInFunction(BaseFunction):
 	def __init__(self, name):
 		super().__init__(name)
 		self.optional_arg_names = []
 		self.optional_arg_values = []
 
-	def execute(self, args, optional_arg_names, optional_arg_values):
+	def execute(self, args, optional_arg_names, optional_arg_values, context, node):
 		res = RTResult()
-		exec_ctx = self.generate_new_context()
+		exec_ctx = self.generate_new_context(context, node)
 
 		method_name = f'execute_{self.name}'
 		method = getattr(self, method_name, self.no_visit_method)
@@ -470,10 +572,7 @@ class BuiltInFunction(BaseFunction):
 		raise Exception(f'No execute_{self.name} method defined')
 
 	def copy(self):
-		copy = BuiltInFunction(self.name)
-		copy.set_context(self.context)
-		copy.set_pos(self.pos_start, self.pos_end)
-		return copy
+		return BuiltInFunction(self.name)
 
 	def __repr__(self):
 		return f"<built-in function {self.name}>"
@@ -520,7 +619,7 @@ class BuiltInFunction(BaseFunction):
 
 		if not isinstance(list_, List):
 			return RTResult().failure(errors.RTError(
-				self.pos_start, self.pos_end,
+				exec_ctx.parent_entry_pos, exec_ctx.parent_entry_end,
 				"First argument must be a list",
 				exec_ctx
 			))
@@ -534,13 +633,13 @@ class BuiltInFunction(BaseFunction):
 		str2 = exec_ctx.symbol_table.get('string2')
 		if not isinstance(str1, String):
 			return RTResult().failure(errors.RTError(
-				self.pos_start, self.pos_end,
+				exec_ctx.parent_entry_pos, exec_ctx.parent_entry_end,
 				"First argument must be a string",
 				exec_ctx
 			))
 		if not isinstance(str2, String):
 			return RTResult().failure(errors.RTError(
-				self.pos_start, self.pos_end,
+				exec_ctx.parent_entry_pos, exec_ctx.parent_entry_end,
 				"Second argument must be a string",
 				exec_ctx
 			))
@@ -556,19 +655,19 @@ class BuiltInFunction(BaseFunction):
 		char = exec_ctx.symbol_table.get('char')
 		if not isinstance(string, String):
 			return RTResult().failure(errors.RTError(
-				self.pos_start, self.pos_end,
+				exec_ctx.parent_entry_pos, exec_ctx.parent_entry_end,
 				"First argument must be a string",
 				exec_ctx
 			))
 		if not isinstance(char, String):
 			return RTResult().failure(errors.RTError(
-				self.pos_start, self.pos_end,
+				exec_ctx.parent_entry_pos, exec_ctx.parent_entry_end,
 				"Second argument must be a string",
 				exec_ctx
 			))
 		if len(list(char.value)) > 1:
 			return RTResult().failure(errors.RTError(
-				self.pos_start, self.pos_end,
+				exec_ctx.parent_entry_pos, exec_ctx.parent_entry_end,
 				"Second argument must be a single character string",
 				exec_ctx
 			))
@@ -584,37 +683,37 @@ class BuiltInFunction(BaseFunction):
 		end = exec_ctx.symbol_table.get('end')
 		if not isinstance(string, String):
 			return RTResult().failure(errors.RTError(
-				self.pos_start, self.pos_end,
+				exec_ctx.parent_entry_pos, exec_ctx.parent_entry_end,
 				"First argument must be a string",
 				exec_ctx
 			))
 		if not isinstance(start, Number):
 			return RTResult().failure(errors.RTError(
-				self.pos_start, self.pos_end,
+				exec_ctx.parent_entry_pos, exec_ctx.parent_entry_end,
 				"Second argument must be a number",
 				exec_ctx
 			))
 		if not isinstance(end, Number):
 			return RTResult().failure(errors.RTError(
-				self.pos_start, self.pos_end,
+				exec_ctx.parent_entry_pos, exec_ctx.parent_entry_end,
 				"Third argument must be a number",
 				exec_ctx
 			))
 		if start.value > len(list(string.value)):
 			return RTResult().failure(errors.RTError(
-				self.pos_start, self.pos_end,
+				exec_ctx.parent_entry_pos, exec_ctx.parent_entry_end,
 				"Second argument exceeds the maximum string length",
 				exec_ctx
 			))
 		if end.value > len(list(string.value)):
 			return RTResult().failure(errors.RTError(
-				self.pos_start, self.pos_end,
+				exec_ctx.parent_entry_pos, exec_ctx.parent_entry_end,
 				"Third argument exceeds the maximum string length",
 				exec_ctx
 			))
 		if end.value < start.value:
 			return RTResult().failure(errors.RTError(
-				self.pos_start, self.pos_end,
+				exec_ctx.parent_entry_pos, exec_ctx.parent_entry_end,
 				"Third argument exceeds the start index value",
 				exec_ctx
 			))
@@ -629,19 +728,19 @@ class BuiltInFunction(BaseFunction):
 		char = exec_ctx.symbol_table.get('char')
 		if not isinstance(string, String):
 			return RTResult().failure(errors.RTError(
-				self.pos_start, self.pos_end,
+				exec_ctx.parent_entry_pos, exec_ctx.parent_entry_end,
 				"First argument must be a string",
 				exec_ctx
 			))
 		if not isinstance(char, String):
 			return RTResult().failure(errors.RTError(
-				self.pos_start, self.pos_end,
+				exec_ctx.parent_entry_pos, exec_ctx.parent_entry_end,
 				"Second argument must be a string",
 				exec_ctx
 			))
 		if len(list(char.value)) > 1:
 			return RTResult().failure(errors.RTError(
-				self.pos_start, self.pos_end,
+				exec_ctx.parent_entry_pos, exec_ctx.parent_entry_end,
 				"Second argument must be a single character string",
 				exec_ctx
 			))
@@ -657,19 +756,19 @@ class BuiltInFunction(BaseFunction):
 		char = exec_ctx.symbol_table.get('char')
 		if not isinstance(string, String):
 			return RTResult().failure(errors.RTError(
-				self.pos_start, self.pos_end,
+				exec_ctx.parent_entry_pos, exec_ctx.parent_entry_end,
 				"First argument must be a string",
 				exec_ctx
 			))
 		if not isinstance(char, String):
 			return RTResult().failure(errors.RTError(
-				self.pos_start, self.pos_end,
+				exec_ctx.parent_entry_pos, exec_ctx.parent_entry_end,
 				"Second argument must be a string",
 				exec_ctx
 			))
 		if len(list(char.value)) > 1:
 			return RTResult().failure(errors.RTError(
-				self.pos_start, self.pos_end,
+				exec_ctx.parent_entry_pos, exec_ctx.parent_entry_end,
 				"Second argument must be a single character string",
 				exec_ctx
 			))
@@ -685,19 +784,19 @@ class BuiltInFunction(BaseFunction):
 		char = exec_ctx.symbol_table.get('char')
 		if not isinstance(list_, List):
 			return RTResult().failure(errors.RTError(
-				self.pos_start, self.pos_end,
+				exec_ctx.parent_entry_pos, exec_ctx.parent_entry_end,
 				"First argument must be a list",
 				exec_ctx
 			))
 		if not isinstance(index, Number):
 			return RTResult().failure(errors.RTError(
-				self.pos_start, self.pos_end,
+				exec_ctx.parent_entry_pos, exec_ctx.parent_entry_end,
 				"Second argument must be a number",
 				exec_ctx
 			))
 		if index.value > len(list_.elements):
 			return RTResult().failure(errors.RTError(
-				self.pos_start, self.pos_end,
+				exec_ctx.parent_entry_pos, exec_ctx.parent_entry_end,
 				"Second argument must be less than length of list",
 				exec_ctx
 			))
@@ -714,7 +813,7 @@ class BuiltInFunction(BaseFunction):
 
 		if not isinstance(list_, List) and not isinstance(list_, Dict):
 			return RTResult().failure(errors.RTError(
-				self.pos_start, self.pos_end,
+				exec_ctx.parent_entry_pos, exec_ctx.parent_entry_end,
 				"First argument must be a list",
 				exec_ctx
 			))
@@ -722,7 +821,7 @@ class BuiltInFunction(BaseFunction):
 		if isinstance(list_, List):
 			if not isinstance(index, Number):
 				return RTResult().failure(errors.RTError(
-					self.pos_start, self.pos_end,
+					exec_ctx.parent_entry_pos, exec_ctx.parent_entry_end,
 					"Second argument must be a number",
 					exec_ctx
 				))
@@ -731,7 +830,7 @@ class BuiltInFunction(BaseFunction):
 				list_.elements[index.value] = value
 			except:
 				return RTResult().failure(errors.RTError(
-					self.pos_start, self.pos_end,
+					exec_ctx.parent_entry_pos, exec_ctx.parent_entry_end,
 					"Could not set that value to the list because the index is out of bounds",
 					exec_ctx
 				))
@@ -740,16 +839,11 @@ class BuiltInFunction(BaseFunction):
 
 		if not isinstance(index, String):
 			return RTResult().failure(errors.RTError(
-				self.pos_start, self.pos_end,
+				exec_ctx.parent_entry_pos, exec_ctx.parent_entry_end,
 				"Second argument must be a string",
 				exec_ctx
 			))
 
-		for k in list_.elements:
-			if index.value == k.value:
-				list_.elements[k] = value
-				return RTResult().success(Number.null)
-		
 		list_.elements[index] = value
 
 		return RTResult().success(Number.null)
@@ -762,14 +856,14 @@ class BuiltInFunction(BaseFunction):
 
 		if not isinstance(list_, List):
 			return RTResult().failure(errors.RTError(
-				self.pos_start, self.pos_end,
+				exec_ctx.parent_entry_pos, exec_ctx.parent_entry_end,
 				"First argument must be a list",
 				exec_ctx
 			))
 
 		if not isinstance(index, Number):
 			return RTResult().failure(errors.RTError(
-				self.pos_start, self.pos_end,
+				exec_ctx.parent_entry_pos, exec_ctx.parent_entry_end,
 				"Second argument must be a number",
 				exec_ctx
 			))
@@ -778,7 +872,7 @@ class BuiltInFunction(BaseFunction):
 			element = list_.elements.pop(index.value)
 		except:
 			return RTResult().failure(errors.RTError(
-				self.pos_start, self.pos_end,
+				exec_ctx.parent_entry_pos, exec_ctx.parent_entry_end,
 				"Element at this index could not be removed from the list because the index is out of bounds",
 				exec_ctx
 			))
@@ -793,14 +887,14 @@ class BuiltInFunction(BaseFunction):
 
 		if not isinstance(listA, List):
 			return RTResult().failure(errors.RTError(
-				self.pos_start, self.pos_end,
+				exec_ctx.parent_entry_pos, exec_ctx.parent_entry_end,
 				"First argument must be a list",
 				exec_ctx
 			))
 
 		if not isinstance(listB, List):
 			return RTResult().failure(errors.RTError(
-				self.pos_start, self.pos_end,
+				exec_ctx.parent_entry_pos, exec_ctx.parent_entry_end,
 				"Second argument must be a list",
 				exec_ctx
 			))
@@ -816,7 +910,7 @@ class BuiltInFunction(BaseFunction):
 
 		if not isinstance(list_, List) and not isinstance(list_, Dict):
 			return RTResult().failure(errors.RTError(
-				self.pos_start, self.pos_end,
+				exec_ctx.parent_entry_pos, exec_ctx.parent_entry_end,
 				"First argument must be a list or a dictionary",
 				exec_ctx
 			))
@@ -824,7 +918,7 @@ class BuiltInFunction(BaseFunction):
 		if isinstance(list_, List):
 			if not isinstance(index, Number):
 				return RTResult().failure(errors.RTError(
-					self.pos_start, self.pos_end,
+					exec_ctx.parent_entry_pos, exec_ctx.parent_entry_end,
 					"Second argument must be a number",
 					exec_ctx
 				))
@@ -833,24 +927,23 @@ class BuiltInFunction(BaseFunction):
 				return RTResult().success(list_.elements[index.value])
 			except:
 				return RTResult().failure(errors.RTError(
-					self.pos_start, self.pos_end,
+					exec_ctx.parent_entry_pos, exec_ctx.parent_entry_end,
 					"Element at this index could not be retrieved because the index is out of bounds",
 					exec_ctx
 				))
 
 		if not isinstance(index, String):
 				return RTResult().failure(errors.RTError(
-					self.pos_start, self.pos_end,
+					exec_ctx.parent_entry_pos, exec_ctx.parent_entry_end,
 					"Second argument must be a string",
 					exec_ctx
 				))
 
-		for k in list_.elements:
-			if index.value == k.value:
-				return RTResult().success(list_.elements[k])
+		if index in list_.elements:
+			return RTResult().success(list_.elements[index])
 
 		return RTResult().failure(errors.RTError(
-			self.pos_start, self.pos_end,
+			exec_ctx.parent_entry_pos, exec_ctx.parent_entry_end,
 			"Could not get any value because that key doesn't exist",
 			exec_ctx
 		))
@@ -863,7 +956,7 @@ class BuiltInFunction(BaseFunction):
 
 		if not isinstance(list_, List):
 			return RTResult().failure(errors.RTError(
-				self.pos_start, self.pos_end,
+				exec_ctx.parent_entry_pos, exec_ctx.parent_entry_end,
 				"Argument must be a list",
 				exec_ctx
 			))
@@ -877,14 +970,14 @@ class BuiltInFunction(BaseFunction):
 
 		if not isinstance(path, String):
 			return RTResult().failure(errors.RTError(
-				self.pos_start, self.pos_end,
+				exec_ctx.parent_entry_pos, exec_ctx.parent_entry_end,
 				"First argument must be a string",
 				exec_ctx
 			))
 
 		if not isinstance(name, String):
 			return RTResult().failure(errors.RTError(
-				self.pos_start, self.pos_end,
+				exec_ctx.parent_entry_pos, exec_ctx.parent_entry_end,
 				"Second argument must be a string",
 				exec_ctx
 			))
@@ -909,7 +1002,7 @@ class BuiltInFunction(BaseFunction):
 
 		if not isinstance(fn, String):
 			return RTResult().failure(errors.RTError(
-				self.pos_start, self.pos_end,
+				exec_ctx.parent_entry_pos, exec_ctx.parent_entry_end,
 				"Argument must be a string",
 				exec_ctx
 			))
@@ -918,7 +1011,7 @@ class BuiltInFunction(BaseFunction):
 
 		if a[len(a)-1] != "kode":
 			return RTResult().failure(errors.RTError(
-				self.pos_start, self.pos_end,
+				exec_ctx.parent_entry_pos, exec_ctx.parent_entry_end,
 				"File extension must be .kode",
 				exec_ctx
 			))
@@ -926,20 +1019,19 @@ class BuiltInFunction(BaseFunction):
 		fn = fn.value
 
 		try:
-			with open(fn, "r") as f:
-				script = f.read()
+			script = load_source(fn)
 		except Exception as e:
 			return RTResult().failure(errors.RTError(
-				self.pos_start, self.pos_end,
+				exec_ctx.parent_entry_pos, exec_ctx.parent_entry_end,
 				f"Failed to load the file \"{fn}\"\n" + str(e),
 				exec_ctx
 			))
 
-		_, error = run(fn, script, module_name)
+		_, error = run(fn, script, module_name, cached=True)
 
 		if error:
 			return RTResult().failure(errors.RTError(
-				self.pos_start, self.pos_end,
+				exec_ctx.parent_entry_pos, exec_ctx.parent_entry_end,
 				f"Failed to finish executing script \"{fn}\"\n" + error.as_string(),
 				exec_ctx
 			))
@@ -954,7 +1046,7 @@ class BuiltInFunction(BaseFunction):
 
 		if isinstance(value, BaseFunction):
 			return RTResult().failure(errors.RTError(
-				self.pos_start, self.pos_end,
+				exec_ctx.parent_entry_pos, exec_ctx.parent_entry_end,
 				f"Cannot convert Function to String",
 				exec_ctx
 			))
@@ -970,7 +1062,7 @@ class BuiltInFunction(BaseFunction):
 			return RTResult().success(Number(int(number.value)))
 		except:
 			return RTResult().failure(errors.RTError(
-				self.pos_start, self.pos_end,
+				exec_ctx.parent_entry_pos, exec_ctx.parent_entry_end,
 				f"Argument can't be converted to Integer",
 				exec_ctx
 			))
@@ -984,7 +1076,7 @@ class BuiltInFunction(BaseFunction):
 			return RTResult().success(Number(float(number.value)))
 		except:
 			return RTResult().failure(errors.RTError(
-				self.pos_start, self.pos_end,
+				exec_ctx.parent_entry_pos, exec_ctx.parent_entry_end,
 				f"Argument can't be converted to Integer",
 				exec_ctx
 			))
@@ -996,7 +1088,7 @@ class BuiltInFunction(BaseFunction):
 
 		if not isinstance(number, Number):
 			return RTResult().failure(errors.RTError(
-				self.pos_start, self.pos_end,
+				exec_ctx.parent_entry_pos, exec_ctx.parent_entry_end,
 				f"Argument must be a number",
 				exec_ctx
 			))
@@ -1010,21 +1102,20 @@ class BuiltInFunction(BaseFunction):
 
 		if not isinstance(d, Dict):
 			return RTResult().failure(errors.RTError(
-				self.pos_start, self.pos_end,
+				exec_ctx.parent_entry_pos, exec_ctx.parent_entry_end,
 				f"First argument must be a dictionary",
 				exec_ctx
 			))
 
 		if not isinstance(key, String):
 			return RTResult().failure(errors.RTError(
-				self.pos_start, self.pos_end,
+				exec_ctx.parent_entry_pos, exec_ctx.parent_entry_end,
 				f"Second argument must be a string",
 				exec_ctx
 			))
 
-		for k in d.elements:
-			if key.value == k.value:
-				return RTResult().success(Number.true)
+		if key in d.elements:
+			return RTResult().success(Number.true)
 		return RTResult().success(Number.false)
 	execute_has_key.arg_names = ['d', 'key']
 
@@ -1034,14 +1125,14 @@ class BuiltInFunction(BaseFunction):
 
 		if not isinstance(begin, Number):
 			return RTResult().failure(errors.RTError(
-				self.pos_start, self.pos_end,
+				exec_ctx.parent_entry_pos, exec_ctx.parent_entry_end,
 				f"First argument must be a number",
 				exec_ctx
 			))
 
 		if not isinstance(end, Number):
 			return RTResult().failure(errors.RTError(
-				self.pos_start, self.pos_end,
+				exec_ctx.parent_entry_pos, exec_ctx.parent_entry_end,
 				f"First argument must be a number",
 				exec_ctx
 			))
@@ -1060,14 +1151,14 @@ class BuiltInFunction(BaseFunction):
 
 		if not isinstance(numberA, Number):
 			return RTResult().failure(errors.RTError(
-				self.pos_start, self.pos_end,
+				exec_ctx.parent_entry_pos, exec_ctx.parent_entry_end,
 				f"Argument must be a number",
 				exec_ctx
 			))
 		
 		if not isinstance(numberB, Number):
 			return RTResult().failure(errors.RTError(
-				self.pos_start, self.pos_end,
+				exec_ctx.parent_entry_pos, exec_ctx.parent_entry_end,
 				f"Argument must be a number",
 				exec_ctx
 			))
@@ -1082,14 +1173,14 @@ class BuiltInFunction(BaseFunction):
 
 		if not isinstance(a, Number):
 			return RTResult().failure(errors.RTError(
-				self.pos_start, self.pos_end,
+				exec_ctx.parent_entry_pos, exec_ctx.parent_entry_end,
 				f"Argument must be a number",
 				exec_ctx
 			))
 		
 		if not isinstance(b, Number):
 			return RTResult().failure(errors.RTError(
-				self.pos_start, self.pos_end,
+				exec_ctx.parent_entry_pos, exec_ctx.parent_entry_end,
 				f"Argument must be a number",
 				exec_ctx
 			))
@@ -1104,7 +1195,7 @@ class BuiltInFunction(BaseFunction):
 
 		if not isinstance(number, Number):
 			return RTResult().failure(errors.RTError(
-				self.pos_start, self.pos_end,
+				exec_ctx.parent_entry_pos, exec_ctx.parent_entry_end,
 				f"Argument must be a number",
 				exec_ctx
 			))
@@ -1118,7 +1209,7 @@ class BuiltInFunction(BaseFunction):
 		number = exec_ctx.symbol_table.get('number')
 		if not isinstance(number, Number):
 			return RTResult().failure(errors.RTError(
-				self.pos_start, self.pos_end,
+				exec_ctx.parent_entry_pos, exec_ctx.parent_entry_end,
 				f"Argument must be a number",
 				exec_ctx
 			))
@@ -1126,9 +1217,7 @@ class BuiltInFunction(BaseFunction):
 		for i in range(1, number.value + 1):
 			fact = fact*i
 
-		number.value = fact	
-
-		return RTResult().success(Number(number.value))
+		return RTResult().success(Number(fact))
 		
 	execute_fact.arg_names = ['number']
 
@@ -1137,7 +1226,7 @@ class BuiltInFunction(BaseFunction):
 		list_ = exec_ctx.symbol_table.get('list')
 		if not isinstance(list_, List):
 			return RTResult().failure(errors.RTError(
-				self.pos_start, self.pos_end,
+				exec_ctx.parent_entry_pos, exec_ctx.parent_entry_end,
 				"Argument must be a list",
 				exec_ctx
 			))
@@ -1154,19 +1243,19 @@ class BuiltInFunction(BaseFunction):
 
 		if not isinstance(number, Number):
 			return RTResult().failure(errors.RTError(
-				self.pos_start, self.pos_end,
+				exec_ctx.parent_entry_pos, exec_ctx.parent_entry_end,
 				f"Argument must be a number",
 				exec_ctx
 			))
 		elif number.value%1 != 0:
 			return RTResult().failure(errors.RTError(
-				self.pos_start, self.pos_end,
+				exec_ctx.parent_entry_pos, exec_ctx.parent_entry_end,
 				f"Argument must be a positive integer",
 				exec_ctx
 			))
 		elif number.value <= 0:
 			return RTResult().failure(errors.RTError(
-				self.pos_start, self.pos_end,
+				exec_ctx.parent_entry_pos, exec_ctx.parent_entry_end,
 				f"Argument must be a positive number",
 				exec_ctx
 			))
@@ -1230,41 +1319,153 @@ BuiltInFunction.is_prime        =   BuiltInFunction("is_prime")
 #######################################
 
 class Context:
-	def __init__(self, display_name, parent=None, parent_entry_pos=None):
+	def __init__(self, display_name, parent=None, parent_entry_pos=None, parent_entry_end=None):
 		self.display_name = display_name
 		self.parent = parent
 		self.parent_entry_pos = parent_entry_pos
+		self.parent_entry_end = parent_entry_end
 		self.symbol_table = None
+		# The number of calls running under the program
+		self.depth = parent.depth + 1 if parent else 0
 
 #######################################
 # SYMBOL TABLE
 #######################################
 
+# A name that no table with a parent has ever held is found in the root of
+# the chain, the global or module table the program runs in, without walking
+# the tables of the calls in between. Those names are kept in local_names,
+# which only grows; version counts the names added to it, so what a lookup
+# cache learnt about a name still holds while version is unchanged
+
 class SymbolTable:
+	version = 0
+	local_names = set()
+
 	def __init__(self, parent=None, name=None):
 		self.symbols = {}
 		self.parent = parent
 		self.name = name
+		self.root = parent.root if parent else self
+
+	def find(self, name):
+		# The value of name in this table only
+		return self.symbols.get(name, None)
 
 	def get(self, name):
-		value = self.symbols.get(name, None)
-		if value == None and self.parent:
-			return self.parent.get(name)
+		# Goes up the chain in a loop, not by recursion: tail calls let it grow
+		# longer than the Python stack
+		table = self
+		value = table.find(name)
+		while value is None and table.parent is not None:
+			table = table.parent
+			value = table.find(name)
 		return value
 
 	def set(self, name, value):
+		if self.parent is not None and name not in SymbolTable.local_names:
+			add_local_name(name)
 		self.symbols[name] = value
 
+	def slot(self, name):
+		# The container and key holding name, for a loop to store its variable
+		# in directly, as set would
+		if self.parent is not None and name not in SymbolTable.local_names:
+			add_local_name(name)
+		return self.symbols, name
+
 	def remove(self, name):
 		del self.symbols[name]
 
 	def __str__(self):
 		return str(self.symbols)
 
+# The symbol table of a call to a function the compiler resolved: its
+# parameters and the names its body assigns live in a list, at the index the
+# layout gives them. Compiled code reads and writes them there; by name, as
+# the functions it calls look them up, they go through the layout. Any other
+# name set in it is kept in symbols
+class Frame(SymbolTable):
+	def __init__(self, layout, parent=None, name=None):
+		super().__init__(parent, name)
+		self.layout = layout
+		self.slots = [None] * len(layout)
+
+	def find(self, name):
+		index = self.layout.get(name)
+		return self.symbols.get(name, None) if index is None else self.slots[index]
+
+	def set(self, name, value):
+		index = self.layout.get(name)
+		if index is None:
+			if name not in SymbolTable.local_names:
+				add_local_name(name)
+			self.symbols[name] = value
+		else:
+			self.slots[index] = value
+
+	def slot(self, name):
+		index = self.layout.get(name)
+		if index is None:
+			return super().slot(name)
+		return self.slots, index
+
+	def remove(self, name):
+		index = self.layout.get(name)
+		if index is None:
+			del self.symbols[name]
+		else:
+			self.slots[index] = None
+
+	def __str__(self):
+		symbols = {name: self.slots[index] for name, index in self.layout.items() if self.slots[index] is not None}
+		symbols.update(self.symbols)
+		return str(symbols)
+
+def add_local_name(name):
+	SymbolTable.local_names.add(name)
+	SymbolTable.version += 1
+
+def lookup(symbol_table, name, cache):
+	# cache is a list holding the version at which name was last seen not to
+	# be local, kept by the node reading it
+	if cache[0] == SymbolTable.version:
+		return symbol_table.root.symbols.get(name)
+	if name in SymbolTable.local_names:
+		return symbol_table.get(name)
+	cache[0] = SymbolTable.version
+	return symbol_table.root.symbols.get(name)
+
 #######################################
 # INTERPRETER
 #######################################
 
+# Values are shared, not copied, when variables are read and functions called.
+# An operation's failure is placed on the operands of the BinOpNode or
+# UnaryOpNode that ran it
+
+def operation_error(error, node, context):
+	if isinstance(node, nodes.UnaryOpNode):
+		pos_start, pos_end = node.node.pos_start, node.node.pos_end
+	elif error.on_right:
+		pos_start, pos_end = node.right_node.pos_start, node.right_node.pos_end
+	else:
+		pos_start, pos_end = node.left_node.pos_start, node.right_node.pos_end
+	return errors.RTError(pos_start, pos_end, error.details, context)
+
+def loop_counter(start, end, step):
+	# The values a for loop's variable takes. Integer bounds and step, the
+	# usual case, are counted by a range; anything else one step at a time
+	if type(start) is int and type(end) is int and type(step) is int and step:
+		return range(start, end, step)
+	return count_steps(start, end, step)
+
+def count_steps(i, end, step):
+	ascending = step >= 0
+	while i < end if ascending else i > end:
+		yield i
+		i += step
+
 class Interpreter:
 	def visit(self, node, context):
 		method_name = f'visit_{type(node).__name__}'
@@ -1277,14 +1478,10 @@ class Interpreter:
 	###################################
 
 	def visit_NumberNode(self, node, context):
-		return RTResult().success(
-			Number(node.tok.value).set_context(context).set_pos(node.pos_start, node.pos_end)
-		)
+		return RTResult().success(new_number(node.value))
 
 	def visit_StringNode(self, node, context):
-		return RTResult().success(
-			String(node.tok.value).set_context(context).set_pos(node.pos_start, node.pos_end)
-		)
+		return RTResult().success(String(node.value))
 
 	def visit_ListNode(self, node, context):
 		res = RTResult()
@@ -1294,9 +1491,7 @@ class Interpreter:
 			elements.append(res.register(self.visit(element_node, context)))
 			if res.should_return(): return res
 
-		return res.success(
-			List(elements).set_context(context).set_pos(node.pos_start, node.pos_end)
-		)
+		return res.success(List(elements))
 
 	def visit_DictNode(self, node, context):
 		res = RTResult()
@@ -1306,14 +1501,12 @@ class Interpreter:
 			dict[res.register(self.visit(key, context))] = res.register(self.visit(node.element_nodes[key], context))
 			if res.should_return(): return res
 
-		return res.success(
-			Dict(dict).set_context(context).set_pos(node.pos_start, node.pos_end)
-		)
+		return res.success(Dict(dict))
 
 	def visit_VarAccessNode(self, node, context):
 		res = RTResult()
-		var_name = node.var_name_tok.value
-		var_module_name = node.module_tok.value if node.module_tok else None
+		var_name = node.var_name
+		var_module_name = node.module_name
 
 		if var_module_name:
 			symbol_table = find_symbol_table(var_module_name)
@@ -1326,8 +1519,11 @@ class Interpreter:
 				))
 
 			value = symbol_table.get(var_name)
-		else:
+		elif var_name in SymbolTable.local_names:
 			value = context.symbol_table.get(var_name)
+		else:
+			# Only in the root, without walking the callers' tables
+			value = context.symbol_table.root.symbols.get(var_name)
 
 		if not value:
 			return res.failure(errors.RTError(
@@ -1335,13 +1531,11 @@ class Interpreter:
 				f"'{var_name}' is not defined",
 				context
 			))
-		# print(type(value))
-		value = value.copy().set_pos(node.pos_start, node.pos_end).set_context(context)
 		return res.success(value)
 
 	def visit_VarAssignNode(self, node, context):
 		res = RTResult()
-		var_name = node.var_name_tok.value
+		var_name = node.var_name
 		value = res.register(self.visit(node.value_node, context))
 
 		if res.should_return(): return res
@@ -1356,41 +1550,41 @@ class Interpreter:
 		right = res.register(self.visit(node.right_node, context))
 		if res.should_return(): return res
 
-		if node.op_tok.type == token.T_PLUS:
+		if node.op == token.T_PLUS:
 			result, error = left.added_to(right)
-		elif node.op_tok.type == token.T_MINUS:
+		elif node.op == token.T_MINUS:
 			result, error = left.subbed_by(right)
-		elif node.op_tok.type == token.T_MUL:
+		elif node.op == token.T_MUL:
 			result, error = left.multed_by(right)
-		elif node.op_tok.type == token.T_DIV:
+		elif node.op == token.T_DIV:
 			result, error = left.dived_by(right)
-		elif node.op_tok.type == token.T_INT_DIV:
+		elif node.op == token.T_INT_DIV:
 			result, error = left.int_dived_by(right)
-		elif node.op_tok.type == token.T_REMAINDER:
+		elif node.op == token.T_REMAINDER:
 			result, error = left.remainder_of(right)
-		elif node.op_tok.type == token.T_POW:
+		elif node.op == token.T_POW:
 			result, error = left.powed_by(right)
-		elif node.op_tok.type == token.T_EE:
+		elif node.op == token.T_EE:
 			result, error = left.get_comparison_eq(right)
-		elif node.op_tok.type == token.T_NE:
+		elif node.op == token.T_NE:
 			result, error = left.get_comparison_ne(right)
-		elif node.op_tok.type == token.T_LT:
+		elif node.op == token.T_LT:
 			result, error = left.get_comparison_lt(right)
-		elif node.op_tok.type == token.T_GT:
+		elif node.op == token.T_GT:
 			result, error = left.get_comparison_gt(right)
-		elif node.op_tok.type == token.T_LTE:
+		elif node.op == token.T_LTE:
 			result, error = left.get_comparison_lte(right)
-		elif node.op_tok.type == token.T_GTE:
+		elif node.op == token.T_GTE:
 			result, error = left.get_comparison_gte(right)
-		elif node.op_tok.matches(token.T_KEYWORD, 'and'):
+		elif node.op == 'and':
 			result, error = left.anded_by(right)
-		elif node.op_tok.matches(token.T_KEYWORD, 'or'):
+		elif node.op == 'or':
 			result, error = left.ored_by(right)
 
 		if error:
-			return res.failure(error)
+			return res.failure(operation_error(error, node, context))
 		else:
-			return res.success(result.set_pos(node.pos_start, node.pos_end))
+			return res.success(result)
 
 	def visit_UnaryOpNode(self, node, context):
 		res = RTResult()
@@ -1399,15 +1593,15 @@ class Interpreter:
 
 		error = None
 
-		if node.op_tok.type == token.T_MINUS:
+		if node.op == token.T_MINUS:
 			number, error = number.multed_by(Number(-1))
-		if node.op_tok.matches(token.T_KEYWORD, 'not'):
+		if node.op == 'not':
 			number, error = number.notted()
 
 		if error:
-			return res.failure(error)
+			return res.failure(operation_error(error, node, context))
 		else:
-			return res.success(number.set_pos(node.pos_start, node.pos_end))
+			return res.success(number)
 
 	def visit_IfNode(self, node, context):
 		res = RTResult()
@@ -1432,12 +1626,13 @@ class Interpreter:
 	def visit_ForEachNode(self, node, context):
 		res = RTResult()
 		elements = []
+		collect = not node.should_return_null
 
 		arr = res.register(self.visit(node.array, context))
 		if res.error: return res
 		
 		for i in arr.elements:
-			context.symbol_table.set(node.var_name_tok.value, Number(i.value))
+			context.symbol_table.set(node.var_name, new_number(i.value))
 
 			value = res.register(self.visit(node.body_node, context))
 
@@ -1449,17 +1644,14 @@ class Interpreter:
 			if res.loop_should_break:
 				break
 
-			elements.append(value)
-		
+			if collect: elements.append(value)
 
-		return res.success(
-			Number.null if node.should_return_null else 
-			List(elements).set_context(context).set_pos(node.pos_start, node.pos_end)
-		)
+		return res.success(List(elements) if collect else Number.null)
 
 	def visit_ForNode(self, node, context):
 		res = RTResult()
 		elements = []
+		collect = not node.should_return_null
 
 		start_value = res.register(self.visit(node.start_value_node, context))
 		if res.should_return(): return res
@@ -1473,37 +1665,32 @@ class Interpreter:
 		else:
 			step_value = Number(1)
 
-		i = start_value.value
-
-		if step_value.value >= 0:
-			condition = lambda: i < end_value.value
-		else:
-			condition = lambda: i > end_value.value
-		
-		while condition():
-			context.symbol_table.set(node.var_name_tok.value, Number(i))
-			i += step_value.value
-
-			value = res.register(self.visit(node.body_node, context))
-
-			if res.should_return() and not res.loop_should_break and not res.loop_should_continue: return res
+		variables, key = context.symbol_table.slot(node.var_name)
+		unseen = nodes.loop_variable_unseen(node)
+		body_node = node.body_node
+		visit_body = getattr(self, f'visit_{type(body_node).__name__}', self.no_visit_method)
 
-			if res.loop_should_continue:
-				continue
+		i = None
+		try:
+			for i in loop_counter(start_value.value, end_value.value, step_value.value):
+				if not unseen: variables[key] = new_number(i)
 
-			if res.loop_should_break:
-				break
+				body_res = visit_body(body_node, context)
+				if body_res.should_return():
+					if body_res.loop_should_continue: continue
+					if body_res.loop_should_break: break
+					return body_res
 
-			elements.append(value)
+				if collect: elements.append(body_res.value)
+		finally:
+			if unseen and i is not None: variables[key] = new_number(i)
 
-		return res.success(
-			Number.null if node.should_return_null else 
-			List(elements).set_context(context).set_pos(node.pos_start, node.pos_end)
-		)
+		return res.success(List(elements) if collect else Number.null)
 
 	def visit_WhileNode(self, node, context):
 		res = RTResult()
 		elements = []
+		collect = not node.should_return_null
 
 		while True:
 			condition = res.register(self.visit(node.condition_node, context))
@@ -1520,17 +1707,14 @@ class Interpreter:
 			if res.loop_should_break:
 				break
 
-			elements.append(value)
+			if collect: elements.append(value)
 
-		return res.success(
-			Number.null if node.should_return_null else 
-			List(elements).set_context(context).set_pos(node.pos_start, node.pos_end)
-		)
+		return res.success(List(elements) if collect else Number.null)
 
 	def visit_FunctionDefNode(self, node, context):
 		res = RTResult()
 
-		func_name = node.var_name_tok.value if node.var_name_tok else None
+		func_name = node.var_name
 
 		if func_name in global_symbol_table.symbols:
 			return res.failure(errors.RTError(
@@ -1540,8 +1724,8 @@ class Interpreter:
 			))
 
 		body_node = node.body_node
-		arg_names = [arg_name.value for arg_name in node.arg_name_toks]
-		optional_arg_names = [optional_arg.value for optional_arg in node.optional_arg_names]
+		arg_names = node.arg_names
+		optional_arg_names = node.optional_arg_names
 		optional_arg_values = []
 
 		for i in node.optional_arg_values:
@@ -1549,9 +1733,10 @@ class Interpreter:
 			if res.error: return res
 		
 		module = node.module
+		mark_tail_calls(node)
 
-		func_value = Function(func_name, body_node, arg_names, optional_arg_names, optional_arg_values, node.should_auto_return, module).set_context(context).set_pos(node.pos_start, node.pos_end)
-		if node.var_name_tok:
+		func_value = Function(func_name, body_node, arg_names, optional_arg_names, optional_arg_values, node.should_auto_return, module)
+		if func_name:
 			context.symbol_table.set(func_name, func_value)
 
 		return res.success(func_value)
@@ -1565,25 +1750,26 @@ class Interpreter:
 		value_to_call = res.register(self.visit(node.node_to_call, context))
 		if res.should_return(): return res
 
-		value_to_call = value_to_call.copy().set_pos(node.pos_start, node.pos_end)
 		for arg_node in node.arg_nodes:
 			args.append(res.register(self.visit(arg_node, context)))
 			if res.should_return(): return res
 
 		optional_names = value_to_call.optional_arg_names
 		for i in range(len(node.optional_arg_names)):
-			if node.optional_arg_names[i].value not in optional_names:
+			if node.optional_arg_names[i] not in optional_names:
 				return res.failure(errors.RTError(
 					node.pos_start, node.pos_end,
-					f"There is no argument named {node.optional_arg_names[i].var_name_tok.value}",
+					f"There is no argument named {node.optional_arg_names[i]}",
 					context
 				))
-			optional_arg_names.append(node.optional_arg_names[i].value)
+			optional_arg_names.append(node.optional_arg_names[i])
 			optional_arg_values.append(res.register(self.visit(node.optional_arg_values[i], context)))
 
-		return_value = res.register(value_to_call.execute(args, optional_arg_names, optional_arg_values))
+		if hasattr(node, '_tail') and isinstance(value_to_call, Function):
+			return res.success(TailCall(value_to_call, args, optional_arg_names, optional_arg_values, context, node))
+
+		return_value = res.register(value_to_call.execute(args, optional_arg_names, optional_arg_values, context, node))
 		if res.should_return(): return res
-		return_value = return_value.copy().set_pos(node.pos_start, node.pos_end).set_context(context)
 		return res.success(return_value)
 
 	def visit_ReturnNode(self, node, context):
@@ -1604,6 +1790,919 @@ class Interpreter:
 		return RTResult().success_break()
 
 
+#######################################
+# COMPILER
+#######################################
+
+# Each node is compiled once into a closure taking the context and giving the
+# node's value, as the matching visit method does. Child closures, the
+# operator and the node's positions are bound when it is compiled, so running
+# a tree does no dispatch on node types. The closure is kept on the node
+
+OPERATION_NAMES = {
+	token.T_PLUS:		'added_to',
+	token.T_MINUS:		'subbed_by',
+	token.T_MUL:		'multed_by',
+	token.T_DIV:		'dived_by',
+	token.T_INT_DIV:	'int_dived_by',
+	token.T_REMAINDER:	'remainder_of',
+	token.T_POW:		'powed_by',
+	token.T_EE:			'get_comparison_eq',
+	token.T_NE:			'get_comparison_ne',
+	token.T_LT:			'get_comparison_lt',
+	token.T_GT:			'get_comparison_gt',
+	token.T_LTE:		'get_comparison_lte',
+	token.T_GTE:		'get_comparison_gte',
+	'and':				'anded_by',
+	'or':				'ored_by',
+}
+
+# Number operations that cannot fail, done without the method call
+NUMBER_OPERATIONS = {
+	token.T_PLUS:		operator.add,
+	token.T_MINUS:		operator.sub,
+	token.T_MUL:		operator.mul,
+	token.T_POW:		operator.pow,
+	token.T_EE:			lambda a, b: int(a == b),
+	token.T_NE:			lambda a, b: int(a != b),
+	token.T_LT:			lambda a, b: int(a < b),
+	token.T_GT:			lambda a, b: int(a > b),
+	token.T_LTE:		lambda a, b: int(a <= b),
+	token.T_GTE:		lambda a, b: int(a >= b),
+	'and':				lambda a, b: int(a and b),
+	'or':				lambda a, b: int(a or b),
+}
+
+# And those that fail on a zero divisor
+NUMBER_DIVISIONS = {
+	token.T_DIV:		operator.truediv,
+	token.T_INT_DIV:	operator.floordiv,
+	token.T_REMAINDER:	operator.mod,
+}
+
+# Results built directly, without the calls their constructor makes. They end
+# up with the same attributes
+def success(value):
+	res = RTResult.__new__(RTResult)
+	res.value = value
+	return res
+
+# Compiled code gives plain values. Errors, returns, break and continue are
+# rare, so instead of a result checked after every step they raise a Signal
+# holding the RTResult the tree interpreter would give at that point; it is
+# caught by the loop or call it concerns, or turned back into that RTResult
+# where a function body or a program ends
+
+class Signal(Exception):
+	def __init__(self, res):
+		self.res = res
+
+def fail(error):
+	raise Signal(RTResult().failure(error))
+
+# A function's locals are resolved when it is compiled: its parameters and the
+# names its body assigns get a slot in its Frame. A nested function's body has
+# its own, but its name and default values are the enclosing function's
+ASSIGNING_NODES = (nodes.VarAssignNode, nodes.ForNode, nodes.ForEachNode, nodes.FunctionDefNode)
+
+def frame_layout(node):
+	layout = {}
+	for name in [*node.arg_names, *node.optional_arg_names]:
+		layout.setdefault(name, len(layout))
+
+	pending = [node.body_node]
+	while pending:
+		for child in nodes.walk(pending.pop(), nodes.FunctionDefNode):
+			if isinstance(child, nodes.FunctionDefNode):
+				pending.extend(child.optional_arg_values)
+			if isinstance(child, ASSIGNING_NODES) and child.var_name:
+				layout.setdefault(child.var_name, len(layout))
+
+	for name in layout:
+		if name not in SymbolTable.local_names:
+			add_local_name(name)
+	return layout
+
+class Compiler:
+	# The layout of the function being compiled, None outside of one
+	layout = None
+
+	def visit(self, node, context):
+		try:
+			return success(self.compile(node)(context))
+		except Signal as signal:
+			return signal.res
+
+	def compile(self, node):
+		try:
+			return node._code
+		except AttributeError:
+			method_name = f'compile_{type(node).__name__}'
+			method = getattr(self, method_name, self.no_compile_method)
+			node._code = method(node)
+			return node._code
+
+	def no_compile_method(self, node):
+		raise Exception(f'No compile_{type(node).__name__} method defined')
+
+	def local_index(self, var_name):
+		return self.layout.get(var_name) if self.layout else None
+
+	def compile_store(self, var_name):
+		# The function storing a variable, called with the symbol table and value
+		index = self.local_index(var_name)
+		if index is None:
+			return lambda symbol_table, value: symbol_table.set(var_name, value)
+
+		def store_local(symbol_table, value):
+			symbol_table.slots[index] = value
+		return store_local
+
+	def compile_number(self, node):
+		# For arithmetic on numbers and variables: a function giving the
+		# expression's value as a plain number, or None whenever it would not be
+		# a Number or would fail. The full closure then evaluates it instead
+		if isinstance(node, nodes.NumberNode):
+			value = node.value
+			return lambda context: value
+
+		if isinstance(node, nodes.VarAccessNode) and not node.module_name:
+			var_name = node.var_name
+			index = self.local_index(var_name)
+
+			if index is not None:
+				# An unset slot gives None, and the full closure looks further
+				def read_local(context):
+					value = context.symbol_table.slots[index]
+					if type(value) is Number: return value.value
+				return read_local
+
+			cache = [-1]
+
+			def read_variable(context):
+				value = lookup(context.symbol_table, var_name, cache)
+				if type(value) is Number: return value.value
+			return read_variable
+
+		if not isinstance(node, nodes.BinOpNode): return None
+		read_left = self.compile_number(node.left_node)
+		read_right = self.compile_number(node.right_node)
+		if not (read_left and read_right): return None
+
+		operation = NUMBER_OPERATIONS.get(node.op)
+		if operation:
+			def read_operation(context):
+				left = read_left(context)
+				if left is None: return None
+				right = read_right(context)
+				if right is None: return None
+				return operation(left, right)
+			return read_operation
+
+		division = NUMBER_DIVISIONS.get(node.op)
+		if division:
+			def read_division(context):
+				left = read_left(context)
+				if left is None: return None
+				right = read_right(context)
+				if right is None or right == 0: return None
+				return division(left, right)
+			return read_division
+
+		return None
+
+	###################################
+
+	def compile_NumberNode(self, node):
+		# Numbers are immutable, so a literal is built once
+		value = new_number(node.value)
+
+		def number(context):
+			return value
+		return number
+
+	def compile_StringNode(self, node):
+		value = node.value
+
+		def string(context):
+			return String(value)
+		return string
+
+	def compile_ListNode(self, node):
+		element_codes = [self.compile(element_node) for element_node in node.element_nodes]
+
+		def list_(context):
+			elements = [element_code(context) for element_code in element_codes]
+			return List(elements)
+		return list_
+
+	def compile_DictNode(self, node):
+		entry_codes = [(self.compile(key), self.compile(value)) for key, value in node.element_nodes.items()]
+
+		def dict_(context):
+			dict = {}
+
+			# The value is evaluated before its key and, as in the tree
+			# interpreter, stored as nothing when it stops
+			for key_code, value_code in entry_codes:
+				try:
+					value = value_code(context)
+				except Signal:
+					value = None
+				dict[key_code(context)] = value
+
+			return Dict(dict)
+		return dict_
+
+	def compile_VarAccessNode(self, node):
+		var_name = node.var_name
+		var_module_name = node.module_name
+		pos_start, pos_end = node.pos_start, node.pos_end
+		index = None if var_module_name else self.local_index(var_name)
+
+		if index is not None:
+			def local_access(context):
+				symbol_table = context.symbol_table
+				value = symbol_table.slots[index]
+				if value is not None: return value
+
+				# Not set in the function yet: looked up in the callers
+				value = symbol_table.parent.get(var_name)
+				if not value:
+					fail(errors.RTError(
+						pos_start, pos_end,
+						f"'{var_name}' is not defined",
+						context
+					))
+				return value
+			return local_access
+
+		# The inline caches of the lookups
+		cache = [-1]
+		module_cache = []
+
+		def var_access(context):
+			if var_module_name:
+				symbol_table = find_symbol_table(var_module_name, module_cache)
+
+				if not symbol_table:
+					fail(errors.RTError(
+						pos_start, pos_end,
+						f"'{var_module_name}' module is not defined",
+						context
+					))
+
+				value = symbol_table.get(var_name)
+			else:
+				value = lookup(context.symbol_table, var_name, cache)
+
+			if not value:
+				fail(errors.RTError(
+					pos_start, pos_end,
+					f"'{var_name}' is not defined",
+					context
+				))
+
+			return value
+		return var_access
+
+	def compile_VarAssignNode(self, node):
+		value_code = self.compile(node.value_node)
+		store = self.compile_store(node.var_name)
+
+		def var_assign(context):
+			value = value_code(context)
+			store(context.symbol_table, value)
+			return value
+		return var_assign
+
+	def compile_BinOpNode(self, node):
+		left_code = self.compile(node.left_node)
+		right_code = self.compile(node.right_node)
+		operation_name = OPERATION_NAMES[node.op]
+		number_operation = NUMBER_OPERATIONS.get(node.op)
+		read_number = self.compile_number(node)
+
+		def bin_op(context):
+			if read_number:
+				value = read_number(context)
+				if value is not None:
+					return new_number(value)
+
+			left = left_code(context)
+			right = right_code(context)
+
+			if number_operation and type(left) is Number and type(right) is Number:
+				return new_number(number_operation(left.value, right.value))
+
+			result, error = getattr(left, operation_name)(right)
+			if error: fail(operation_error(error, node, context))
+			return result
+		return bin_op
+
+	def compile_UnaryOpNode(self, node):
+		code = self.compile(node.node)
+		op = node.op
+
+		def unary_op(context):
+			number = code(context)
+			error = None
+
+			if op == token.T_MINUS:
+				number, error = number.multed_by(Number(-1))
+			if op == 'not':
+				number, error = number.notted()
+
+			if error: fail(operation_error(error, node, context))
+			return number
+		return unary_op
+
+	def compile_IfNode(self, node):
+		case_codes = [
+			(self.compile(condition), self.compile(expr), should_return_null)
+			for condition, expr, should_return_null in node.cases
+		]
+		else_code = None
+		if node.else_case:
+			expr, else_should_return_null = node.else_case
+			else_code = self.compile(expr)
+
+		def if_(context):
+			for condition_code, expr_code, should_return_null in case_codes:
+				if condition_code(context).is_true():
+					value = expr_code(context)
+					return Number.null if should_return_null else value
+
+			if else_code:
+				value = else_code(context)
+				return Number.null if else_should_return_null else value
+
+			return Number.null
+		return if_
+
+	# In the loops, a Signal from the body carrying break or continue is for the
+	# loop; any other one goes on to the enclosing code
+
+	def compile_ForEachNode(self, node):
+		array_code = self.compile(node.array)
+		body_code = self.compile(node.body_node)
+		store = self.compile_store(node.var_name)
+		collect = not node.should_return_null
+
+		def for_each(context):
+			elements = []
+
+			# Only errors stop the loop before it starts
+			try:
+				arr = array_code(context)
+			except Signal as signal:
+				if signal.res.error: raise
+				arr = None
+
+			symbol_table = context.symbol_table
+			for i in arr.elements:
+				store(symbol_table, new_number(i.value))
+
+				try:
+					value = body_code(context)
+				except Signal as signal:
+					if signal.res.loop_should_continue: continue
+					if signal.res.loop_should_break: break
+					raise
+
+				if collect: elements.append(value)
+
+			return List(elements) if collect else Number.null
+		return for_each
+
+	def compile_ForNode(self, node):
+		start_value_code = self.compile(node.start_value_node)
+		end_value_code = self.compile(node.end_value_node)
+		step_value_code = self.compile(node.step_value_node) if node.step_value_node else None
+		body_code = self.compile(node.body_node)
+		var_name = node.var_name
+		unseen = nodes.loop_variable_unseen(node)
+		collect = not node.should_return_null
+
+		def for_(context):
+			elements = []
+
+			start_value = start_value_code(context)
+			end_value = end_value_code(context)
+			step_value = step_value_code(context) if step_value_code else Number(1)
+
+			variables, key = context.symbol_table.slot(var_name)
+
+			i = None
+			try:
+				for i in loop_counter(start_value.value, end_value.value, step_value.value):
+					if not unseen: variables[key] = new_number(i)
+
+					try:
+						value = body_code(context)
+					except Signal as signal:
+						if signal.res.loop_should_continue: continue
+						if signal.res.loop_should_break: break
+						raise
+
+					if collect: elements.append(value)
+			finally:
+				if unseen and i is not None: variables[key] = new_number(i)
+
+			return List(elements) if collect else Number.null
+		return for_
+
+	def compile_WhileNode(self, node):
+		condition_code = self.compile(node.condition_node)
+		body_code = self.compile(node.body_node)
+		collect = not node.should_return_null
+
+		def while_(context):
+			elements = []
+
+			while condition_code(context).is_true():
+				try:
+					value = body_code(context)
+				except Signal as signal:
+					if signal.res.loop_should_continue: continue
+					if signal.res.loop_should_break: break
+					raise
+
+				if collect: elements.append(value)
+
+			return List(elements) if collect else Number.null
+		return while_
+
+	def compile_FunctionDefNode(self, node):
+		func_name = node.var_name
+		body_node = node.body_node
+		arg_names = node.arg_names
+		optional_arg_names = node.optional_arg_names
+		optional_arg_codes = [self.compile(i) for i in node.optional_arg_values]
+		should_auto_return = node.should_auto_return
+		module = node.module
+		pos_start, pos_end = node.pos_start, node.pos_end
+		store = self.compile_store(func_name) if func_name else None
+
+		# The body is compiled with its definition, against the function's own
+		# layout; Function.execute finds it on the node
+		mark_tail_calls(node)
+		layout = frame_layout(node)
+		outer_layout = self.layout
+		self.layout = layout
+		try:
+			self.compile(body_node)
+		finally:
+			self.layout = outer_layout
+
+		def function_def(context):
+			if func_name in global_symbol_table.symbols:
+				fail(errors.RTError(
+					pos_start, pos_end,
+					f"There is a function called '{func_name}' already defined",
+					context
+				))
+
+			optional_arg_values = []
+
+			# Only errors stop the definition
+			for optional_arg_code in optional_arg_codes:
+				try:
+					optional_arg_values.append(optional_arg_code(context))
+				except Signal as signal:
+					if signal.res.error: raise
+					optional_arg_values.append(None)
+
+			func_value = Function(func_name, body_node, arg_names, optional_arg_names, optional_arg_values, should_auto_return, module, self, layout)
+			if store:
+				store(context.symbol_table, func_value)
+
+			return func_value
+		return function_def
+
+	def compile_CallNode(self, node):
+		node_to_call_code = self.compile(node.node_to_call)
+		arg_codes = [self.compile(arg_node) for arg_node in node.arg_nodes]
+		call_optional_arg_names = node.optional_arg_names
+		optional_arg_codes = [self.compile(value) for value in node.optional_arg_values]
+		pos_start, pos_end = node.pos_start, node.pos_end
+		tail = hasattr(node, '_tail')
+
+		def call(context):
+			optional_arg_names = []
+			optional_arg_values = []
+
+			value_to_call = node_to_call_code(context)
+			args = [arg_code(context) for arg_code in arg_codes]
+
+			# Optional values are passed as nothing when they stop
+			optional_names = value_to_call.optional_arg_names
+			for i in range(len(call_optional_arg_names)):
+				if call_optional_arg_names[i] not in optional_names:
+					fail(errors.RTError(
+						pos_start, pos_end,
+						f"There is no argument named {call_optional_arg_names[i]}",
+						context
+					))
+				optional_arg_names.append(call_optional_arg_names[i])
+				try:
+					optional_arg_values.append(optional_arg_codes[i](context))
+				except Signal:
+					optional_arg_values.append(None)
+
+			if tail and isinstance(value_to_call, Function):
+				return TailCall(value_to_call, args, optional_arg_names, optional_arg_values, context, node)
+
+			# Functions still give an RTResult: a break or continue in one stops
+			# the caller's loop
+			res = value_to_call.execute(args, optional_arg_names, optional_arg_values, context, node)
+			if res.should_return(): raise Signal(res)
+			return res.value
+		return call
+
+	def compile_ReturnNode(self, node):
+		code = self.compile(node.node_to_return) if node.node_to_return else None
+
+		def return_(context):
+			value = code(context) if code else Number.null
+			raise Signal(RTResult().success_return(value))
+		return return_
+
+	def compile_ContinueNode(self, node):
+		def continue_(context):
+			raise Signal(RTResult().success_continue())
+		return continue_
+
+	def compile_BreakNode(self, node):
+		def break_(context):
+			raise Signal(RTResult().success_break())
+		return break_
+
+#######################################
+# VIRTUAL MACHINE
+#######################################
+
+# Runs the bytecode from lib/bytecode.py, compiled once per node and kept on
+# it. Each Code runs with its own value stack and stack of running loops
+
+BINARY_METHODS = [OPERATION_NAMES[op] for op in bytecode.BINARY_OPERATORS]
+BINARY_NUMBER_OPERATIONS = [NUMBER_OPERATIONS.get(op) for op in bytecode.BINARY_OPERATORS]
+BINARY_NUMBER_DIVISIONS = [NUMBER_DIVISIONS.get(op) for op in bytecode.BINARY_OPERATORS]
+
+class LoopState:
+	# last is the value a for loop whose variable is unseen counted last, to be
+	# stored when it ends
+	__slots__ = ('elements', 'var_name', 'iterator', 'variables', 'key', 'unseen', 'last')
+
+	def __init__(self, var_name=None):
+		self.elements = []
+		self.var_name = var_name
+		self.last = None
+
+def finish_loops(stack):
+	# The loops of code that stops before they end store their last value too
+	for state in stack:
+		if type(state) is LoopState and state.last is not None:
+			state.variables[state.key] = new_number(state.last)
+
+class VM:
+	def visit(self, node, context):
+		return self.execute(self.compile(node), context)
+
+	def compile(self, node):
+		try:
+			return node._bytecode
+		except AttributeError:
+			node._bytecode = bytecode.compile_code(node)
+			return node._bytecode
+
+	def unwind(self, res, stack, blocks, ip):
+		# Where a break or continue carries on in this code, or -1 when the
+		# result has to leave it. Only a loop's body stops it: one from a while
+		# condition goes on to the enclosing loop
+		if res.error or res.func_return_value: return -1
+		while blocks:
+			exit, resume, body, depth = blocks[-1]
+			if ip > body:
+				del stack[depth:]
+				return exit if res.loop_should_break else resume
+			blocks.pop()
+		return -1
+
+	def execute(self, code, context):
+		# The functions this engine defined are called without recursing: the
+		# state of the code making the call is saved in frames, a list on the
+		# heap, and the function's body runs in this same loop. Each frame also
+		# holds the function being run
+		frames = []
+		stack = []
+		blocks = []
+		ip = 0
+
+		while True:
+			instructions = code.instructions
+			constants = code.constants
+			positions = code.positions()
+			push = stack.append
+			pop = stack.pop
+
+			# Set when the running code stops. Left None when a call starts, and
+			# the called body is run from its first instruction
+			result = None
+
+			while True:
+				op = instructions[ip]
+				arg = instructions[ip + 1]
+				ip += 2
+
+				if op == bytecode.OP_LOAD:
+					var_name, cache = constants[arg]
+					value = lookup(context.symbol_table, var_name, cache)
+					if not value:
+						pos_start, pos_end = positions[(ip >> 1) - 1]
+						result = RTResult().failure(errors.RTError(
+							pos_start, pos_end,
+							f"'{var_name}' is not defined",
+							context
+						))
+						break
+					push(value)
+
+				elif op == bytecode.OP_NUMBER:
+					push(new_number(constants[arg]))
+
+				elif op == bytecode.OP_BINARY:
+					right = pop()
+					left = pop()
+
+					if type(left) is Number and type(right) is Number:
+						operation = BINARY_NUMBER_OPERATIONS[arg]
+						if operation:
+							push(new_number(operation(left.value, right.value)))
+							continue
+
+						division = BINARY_NUMBER_DIVISIONS[arg]
+						if division and right.value != 0:
+							push(new_number(division(left.value, right.value)))
+							continue
+
+					value, error = getattr(left, BINARY_METHODS[arg])(right)
+					if error:
+						result = RTResult().failure(operation_error(error, code.nodes[(ip >> 1) - 1], context))
+						break
+					push(value)
+
+				elif op == bytecode.OP_STORE:
+					context.symbol_table.set(constants[arg], stack[-1])
+
+				elif op == bytecode.OP_JUMP_IF_FALSE:
+					if not pop().is_true(): ip = arg
+
+				elif op == bytecode.OP_JUMP:
+					ip = arg
+
+				elif op == bytecode.OP_FOR_ITER:
+					state = stack[-1]
+					i = next(state.iterator, LoopState)
+					if i is LoopState:
+						ip = arg
+					elif state.unseen:
+						state.last = i
+					else:
+						state.variables[state.key] = new_number(i)
+
+				elif op == bytecode.OP_LOOP_APPEND:
+					value = pop()
+					stack[-1].elements.append(value)
+
+				elif op == bytecode.OP_POP:
+					pop()
+
+				elif op == bytecode.OP_BUILD_LIST:
+					if arg:
+						elements = stack[-arg:]
+						del stack[-arg:]
+					else:
+						elements = []
+					push(List(elements))
+
+				elif op == bytecode.OP_STRING:
+					push(String(constants[arg]))
+
+				elif op == bytecode.OP_NULL:
+					push(Number.null)
+
+				elif op == bytecode.OP_OPTIONAL_NAMES:
+					push(stack[-1 - arg].optional_arg_names)
+
+				elif op == bytecode.OP_CHECK_ARGUMENT:
+					name, pushed = constants[arg]
+					if name not in stack[-1 - pushed]:
+						pos_start, pos_end = positions[(ip >> 1) - 1]
+						result = RTResult().failure(errors.RTError(
+							pos_start, pos_end,
+							f"There is no argument named {name}",
+							context
+						))
+						break
+
+				elif op == bytecode.OP_CALL:
+					arg_count, optional_arg_names, tail = constants[arg]
+					optional_arg_values = stack[len(stack) - len(optional_arg_names):]
+					del stack[len(stack) - len(optional_arg_names) - 1:]
+					args = stack[len(stack) - arg_count:]
+					del stack[len(stack) - arg_count:]
+					value_to_call = pop()
+					node = code.nodes[(ip >> 1) - 1]
+
+					if tail and isinstance(value_to_call, Function):
+						push(TailCall(value_to_call, args, list(optional_arg_names), optional_arg_values, context, node))
+						continue
+
+					if isinstance(value_to_call, Function) and isinstance(value_to_call.interpreter, VM):
+						exec_ctx, res = value_to_call.start(args, list(optional_arg_names), optional_arg_values, context, node)
+						if res is None:
+							frames.append((value_to_call, code, ip, stack, blocks, context))
+							code, stack, blocks, ip, context = self.compile(value_to_call.body_node), [], [], 0, exec_ctx
+							break
+					else:
+						res = value_to_call.execute(args, list(optional_arg_names), optional_arg_values, context, node)
+
+					if res.should_return():
+						ip = self.unwind(res, stack, blocks, ip)
+						if ip < 0:
+							result = res
+							break
+						continue
+					push(res.value)
+
+				elif op == bytecode.OP_UNARY:
+					number = pop()
+					error = None
+
+					if arg == bytecode.UNARY_MINUS:
+						number, error = number.multed_by(Number(-1))
+					elif arg == bytecode.UNARY_NOT:
+						number, error = number.notted()
+
+					if error:
+						node = code.nodes[(ip >> 1) - 1]
+						result = RTResult().failure(operation_error(error, node, context))
+						break
+					push(number)
+
+				elif op == bytecode.OP_LOAD_MODULE:
+					module_name, var_name, module_cache = constants[arg]
+					pos_start, pos_end = positions[(ip >> 1) - 1]
+					symbol_table = find_symbol_table(module_name, module_cache)
+
+					if not symbol_table:
+						result = RTResult().failure(errors.RTError(
+							pos_start, pos_end,
+							f"'{module_name}' module is not defined",
+							context
+						))
+						break
+
+					value = symbol_table.get(var_name)
+					if not value:
+						result = RTResult().failure(errors.RTError(
+							pos_start, pos_end,
+							f"'{var_name}' is not defined",
+							context
+						))
+						break
+					push(value)
+
+				elif op == bytecode.OP_BUILD_DICT:
+					entries = stack[len(stack) - 2 * arg:]
+					del stack[len(stack) - 2 * arg:]
+					dict = {}
+					for i in range(0, len(entries), 2):
+						dict[entries[i + 1]] = entries[i]
+					push(Dict(dict))
+
+				elif op == bytecode.OP_EVAL:
+					push(self.execute(constants[arg], context).value)
+
+				elif op == bytecode.OP_EVAL_CHECKED:
+					res = self.execute(constants[arg], context)
+					if res.error:
+						result = res
+						break
+					push(res.value)
+
+				elif op == bytecode.OP_FOR_PREP:
+					var_name, has_step, unseen = constants[arg]
+					step_value = pop() if has_step else None
+					end_value = pop()
+					start_value = pop()
+
+					state = LoopState()
+					state.iterator = iter(loop_counter(start_value.value, end_value.value, step_value.value if has_step else 1))
+					state.variables, state.key = context.symbol_table.slot(var_name)
+					state.unseen = unseen
+					push(state)
+
+				elif op == bytecode.OP_FOREACH_PREP:
+					state = LoopState(constants[arg])
+					state.iterator = iter(pop().elements)
+					push(state)
+
+				elif op == bytecode.OP_FOREACH_ITER:
+					state = stack[-1]
+					element = next(state.iterator, LoopState)
+					if element is LoopState:
+						ip = arg
+					else:
+						context.symbol_table.set(state.var_name, new_number(element.value))
+
+				elif op == bytecode.OP_WHILE_PREP:
+					push(LoopState())
+
+				elif op == bytecode.OP_SETUP_LOOP:
+					exit, body = constants[arg]
+					blocks.append((exit, ip, body, len(stack)))
+
+				elif op == bytecode.OP_POP_BLOCK:
+					blocks.pop()
+
+				elif op == bytecode.OP_LOOP_END:
+					state = pop()
+					if state.last is not None:
+						state.variables[state.key] = new_number(state.last)
+					if arg:
+						push(Number.null)
+					else:
+						push(List(state.elements))
+
+				elif op == bytecode.OP_CHECK_FUNCTION:
+					func_name = constants[arg]
+					if func_name in global_symbol_table.symbols:
+						pos_start, pos_end = positions[(ip >> 1) - 1]
+						result = RTResult().failure(errors.RTError(
+							pos_start, pos_end,
+							f"There is a function called '{func_name}' already defined",
+							context
+						))
+						break
+
+				elif op == bytecode.OP_MAKE_FUNCTION:
+					node = constants[arg]
+					mark_tail_calls(node)
+					count = len(node.optional_arg_values)
+					optional_arg_values = stack[len(stack) - count:]
+					del stack[len(stack) - count:]
+
+					func_value = Function(node.var_name, node.body_node, node.arg_names, node.optional_arg_names, optional_arg_values, node.should_auto_return, node.module, self)
+					if node.var_name:
+						context.symbol_table.set(node.var_name, func_value)
+					push(func_value)
+
+				elif op == bytecode.OP_RETURN:
+					result = RTResult().success_return(pop())
+					break
+
+				elif op == bytecode.OP_BREAK or op == bytecode.OP_CONTINUE:
+					res = RTResult().success_break() if op == bytecode.OP_BREAK else RTResult().success_continue()
+					ip = self.unwind(res, stack, blocks, ip)
+					if ip < 0:
+						result = res
+						break
+
+				elif op == bytecode.OP_END:
+					result = success(pop())
+					break
+
+			if result is None: continue
+
+			# The running code has stopped. When it is the body of a call made in
+			# this loop, the code that made the call carries on with the call's
+			# result, which may be a tail call to run in its place
+			while result is not None:
+				if blocks: finish_loops(stack)
+				if not frames: return result
+				function, code, ip, stack, blocks, context = frames.pop()
+				result = function.finish(result)
+
+				tail_call = result.value
+				if type(tail_call) is TailCall:
+					function = tail_call.function
+					if isinstance(function.interpreter, VM):
+						exec_ctx, result = function.start(tail_call.args, tail_call.optional_arg_names, tail_call.optional_arg_values, tail_call.context, tail_call.node, True)
+						if result is None:
+							frames.append((function, code, ip, stack, blocks, context))
+							code, stack, blocks, ip, context = self.compile(function.body_node), [], [], 0, exec_ctx
+							break
+					else:
+						result = function.execute(tail_call.args, tail_call.optional_arg_names, tail_call.optional_arg_values, tail_call.context, tail_call.node)
+
+				if result.should_return():
+					ip = self.unwind(result, stack, blocks, ip)
+					if ip >= 0: result = None
+				else:
+					stack.append(result.value)
+					result = None
 
 def reset_global_symbol_table():
 	global_symbol_table = SymbolTable()
@@ -1649,31 +2748,114 @@ def reset_global_symbol_table():
 global_symbol_table = reset_global_symbol_table()
 modules_symbol_table = []
 
-def find_symbol_table(name):
-	for table in modules_symbol_table:
-		if table.name == name: return table
+def find_symbol_table(name, cache=None):
+	# cache, a list of two, keeps the index and the table the last search found.
+	# Modules are only added at the end, so while that table is still at that
+	# index it is still the first one of its name
+	if cache and cache[0] < len(modules_symbol_table) and modules_symbol_table[cache[0]] is cache[1]:
+		return cache[1]
+
+	for i, table in enumerate(modules_symbol_table):
+		if table.name == name:
+			if cache is not None: cache[:] = i, table
+			return table
 	return None
 
 #####################
 # RUN
 #####################
-def run(fn, text, module_name=""):
-	# Generate tokens
-	lex = lexer.Lexer(fn, text)
-	tokens, error = lex.make_tokens()
+
+ENGINES = {
+	'tree':		Interpreter,
+	'closure':	Compiler,
+	'vm':		VM,
+}
+DEFAULT_ENGINE = 'closure'
+current_engine = DEFAULT_ENGINE
+
+# Calls nested deeper than this fail with an RTError. Only the virtual machine
+# keeps its calls off the Python stack, so the others may run out before
+max_call_depth = 10000
+
+def run_file(fn, engine=DEFAULT_ENGINE):
+	global global_symbol_table, current_engine
+	global_symbol_table = reset_global_symbol_table()
+	# Files the program runs or imports use the same engine
+	current_engine = engine
+
+	# Parse the files the program imports before it starts, in parallel
+	text = load_source(fn)
+	node, error = load_ast(fn, text)
 	if error: return None, error
+	prefetch.prefetch_imports(node)
+
+	return run(fn, text, cached=True, engine=engine)
 
-	# Generate AST
-	pars = parser.Parser(tokens)
+def generate_ast(fn, text, statement_starts=None):
+	# Generate AST, pulling tokens from the lexer as the parser needs them
+	lex = lexer.Lexer(fn, text)
+	tokens = lex.generate_tokens()
+	pars = parser.Parser(tokens, statement_starts)
 	ast = pars.parse()
+
+	# A lexing error anywhere in the file takes precedence, as if the whole
+	# file had been tokenised first
+	if ast.error and not lex.error:
+		for _ in tokens: pass
+	if lex.error: return None, lex.error
 	if ast.error: return None, ast.error
+	return ast.node, None
+
+def load_ast(fn, text):
+	digest = cache.source_digest(text)
+	node = cache.load(fn, digest, text)
+	if node is not None: return node, None
+
+	node, error = reparse_ast(fn, text)
+	if not error: cache.store(fn, digest, node)
+	return node, error
+
+def reparse_ast(fn, text):
+	# Start from the last version of this file parsed by this process, if any
+	path = os.path.abspath(fn)
+	previous = incremental.documents.get(path)
+	document = previous and incremental.reparse(fn, previous, text)
+
+	if not document:
+		starts = []
+		node, error = generate_ast(fn, text, starts)
+		if error: return None, error
+		document = incremental.Document(node, text, starts)
+
+	incremental.documents[path] = document
+	return document.node, None
+
+def run(fn, text, module_name="", cached=False, engine=None):
+	# Files are parsed once per content and kept in the on-disk AST cache
+	node, error = load_ast(fn, text) if cached else generate_ast(fn, text)
+	if error: return None, error
 
-	inter = Interpreter()
+	inter = ENGINES[engine or current_engine]()
 	context = Context('<program>')
 	if not module_name:
 		context.symbol_table = global_symbol_table
 	else:
 		context.symbol_table = find_symbol_table(module_name)
-	result = inter.visit(ast.node, context)
 
-	return result.value, result.error
+	# The statements are run one at a time, so that nesting too deep for the
+	# Python stack, which the parser takes but the engines compile and
+	# evaluate recursively, is reported on the statement it is in
+	elements = []
+	for statement in node.element_nodes:
+		try:
+			result = inter.visit(statement, context)
+		except RecursionError:
+			return None, errors.RTError(
+				statement.pos_start, statement.pos_end,
+				"Maximum recursion depth exceeded",
+				context
+			)
+		if result.should_return(): return result.value, result.error
+		elements.append(result.value)
+
+	return List(elements), None
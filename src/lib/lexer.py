@@ -1,12 +1,16 @@
 from lib.utils import token, position
 from lib import errors
+import mmap
+import os
 import string
+import sys
+import re
 
 DIGITS      	= '0123456789'
 LETTERS			= string.ascii_letters
 LETTERS_DIGITS	= LETTERS + DIGITS
 
-KEYWORDS = [
+KEYWORDS = frozenset([
 	'var',
 	'and',
 	'or',
@@ -25,25 +29,206 @@ KEYWORDS = [
 	'return',
 	'continue',
 	'in'
-]
+])
+
+LEXER_LEGACY	= 'legacy'
+LEXER_TABLE		= 'table'
+LEXER_MODES		= (LEXER_LEGACY, LEXER_TABLE)
+
+DEFAULT_MODE	= LEXER_TABLE
+
+TOKEN_PATTERN = r'''
+	(?P<WHITESPACE>[ \t]+)
+	|(?P<NEWLINE>%(newline)s)
+	|(?P<FLOAT>[0-9]+\.[0-9]*)
+	|(?P<INT>[0-9]+)
+	|(?P<IDENTIFIER>[A-Za-z][A-Za-z0-9_]*)
+	|(?P<STRING>"[^"]*")
+	|(?P<UNTERMINATED_STRING>"[^"]*)
+	|(?P<OPERATOR>->|//|==|!=|<=|>=|[-+*/%%^()\[\]{}:,.=<>])
+	|(?P<BLOCK_COMMENT>@/(?s:.*?)/(?=@))
+	|(?P<UNTERMINATED_COMMENT>@/)
+	|(?P<COMMENT>@%(rest_of_line)s)
+	|(?P<ILLEGAL>%(illegal)s)
+'''
+
+TOKEN_REGEX = re.compile(TOKEN_PATTERN % {
+	'newline': r'[;\n]',
+	'rest_of_line': r'[^\n]*\n?',
+	'illegal': r'.',
+}, re.VERBOSE)
+
+# Files are matched as raw bytes: CRLF and lone CR line endings are accepted
+# the way text-mode reads translated them, and an illegal multi-byte
+# character is reported whole
+TOKEN_REGEX_BYTES = re.compile((TOKEN_PATTERN % {
+	'newline': r'[;\n]|\r\n?',
+	'rest_of_line': r'[^\r\n]*(?:\r\n?|\n)?',
+	'illegal': r'[\xc0-\xff][\x80-\xbf]*|.',
+}).encode('ascii'), re.VERBOSE)
+
+OPERATORS = {
+	'+':	token.T_PLUS,
+	'-':	token.T_MINUS,
+	'*':	token.T_MUL,
+	'/':	token.T_DIV,
+	'//':	token.T_INT_DIV,
+	'%':	token.T_REMAINDER,
+	'^':	token.T_POW,
+	'(':	token.T_LPAREN,
+	')':	token.T_RPAREN,
+	'[':	token.T_LSQUARE,
+	']':	token.T_RSQUARE,
+	'{':	token.T_LCURLY,
+	'}':	token.T_RCURLY,
+	':':	token.T_COLON,
+	',':	token.T_COMMA,
+	'.':	token.T_DOT,
+	'->':	token.T_ARROW,
+	'=':	token.T_EQ,
+	'==':	token.T_EE,
+	'!=':	token.T_NE,
+	'<':	token.T_LT,
+	'>':	token.T_GT,
+	'<=':	token.T_LTE,
+	'>=':	token.T_GTE,
+}
+
+OPERATORS_BYTES = {op.encode('ascii'): tok_type for op, tok_type in OPERATORS.items()}
+
+#######################################
+# SOURCE
+#######################################
+
+# Files up to this size are read into bytes. Larger ones are mapped. A map
+# stays open for as long as the file's tree is used, and on Windows the file
+# cannot be rewritten meanwhile
+MAP_THRESHOLD = 1 << 24
+
+def load_source(fn):
+	# Either way the file is not decoded: the lexer matches tokens in place and
+	# only token text and the lines shown in error messages are ever decoded
+	with open(fn, "rb") as f:
+		if os.fstat(f.fileno()).st_size <= MAP_THRESHOLD:
+			return f.read()
+		return mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
 
 #######################################
 # LEXER
 #######################################
 
 class Lexer:
-	def __init__(self, fn, text):
+	def __init__(self, fn, text, mode=None):
 		self.fn = fn
+		self.mode = mode or DEFAULT_MODE
+
+		# The table lexer matches a file's bytes in place; the legacy lexer walks
+		# characters and needs the decoded text
+		if not isinstance(text, str) and self.mode != LEXER_TABLE:
+			text = bytes(text).decode('utf-8').replace('\r\n', '\n').replace('\r', '\n')
+
 		self.text = text
-		self.pos = position.Position(-1, 0, -1, fn, text)
+		self.src = position.make_source(fn, text)
+		self.pos = position.Position(-1, self.src)
+		self.error = None
 		self.current_char = None
 		self.advance()
 	
 	def advance(self):
-		self.pos.advance(self.current_char)
+		self.pos.advance()
 		self.current_char = self.text[self.pos.idx] if self.pos.idx < len(self.text) else None
 
 	def make_tokens(self):
+		if self.mode == LEXER_TABLE:
+			tokens = list(self.generate_tokens())
+			if self.error: return [], self.error
+			return tokens, None
+		return self.make_tokens_legacy()
+
+	def generate_tokens(self, start=0, end=None):
+		# The table lexer can also read just text[start:end], as if the text
+		# stopped there, keeping positions relative to the whole file
+		if self.mode != LEXER_TABLE:
+			tokens, error = self.make_tokens_legacy()
+			if error:
+				yield self.fail(error)
+			yield from tokens
+			return
+
+		src = self.src
+		text = self.text
+		text_len = len(text) if end is None else end
+		binary = not isinstance(text, str)
+		match = (TOKEN_REGEX_BYTES if binary else TOKEN_REGEX).match
+		operators = OPERATORS_BYTES if binary else OPERATORS
+		intern = sys.intern
+		idx = start
+
+		while idx < text_len:
+			m = match(text, idx, text_len)
+			kind = m.lastgroup
+			end = m.end()
+
+			if kind == 'WHITESPACE' or kind == 'COMMENT':
+				idx = end
+				continue
+
+			if kind == 'IDENTIFIER':
+				value = m.group()
+				value = intern(value.decode('ascii') if binary else value)
+				tok_type = token.T_KEYWORD if value in KEYWORDS else token.T_IDENTIFIER
+				yield token.Token(tok_type, value, position.Position(idx, src), position.Position(end, src))
+			elif kind == 'OPERATOR':
+				yield token.Token(operators[m.group()], None, position.Position(idx, src), position.Position(end, src))
+			elif kind == 'INT':
+				yield token.Token(token.T_INT, int(m.group()), position.Position(idx, src), position.Position(end, src))
+			elif kind == 'FLOAT':
+				yield token.Token(token.T_FLOAT, float(m.group()), position.Position(idx, src), position.Position(end, src))
+			elif kind == 'NEWLINE':
+				yield token.Token(token.T_NEWLINE, None, position.Position(idx, src), position.Position(end, src))
+			elif kind == 'STRING' or kind == 'UNTERMINATED_STRING':
+				if kind == 'STRING':
+					value = m.group()[1:-1]
+				else:
+					# An unterminated string runs to the end of the file and then one
+					# character past it, exactly like the character-by-character lexer
+					value = m.group()[1:]
+					end += 1
+
+				if binary:
+					value = value.decode('utf-8', 'replace')
+					# Line breaks inside the string read as text mode gave them
+					if '\r' in value: value = value.replace('\r\n', '\n').replace('\r', '\n')
+				yield token.Token(token.T_STRING, value.replace('\\', ''), position.Position(idx, src), position.Position(end, src))
+			elif kind == 'BLOCK_COMMENT':
+				# The closing '@' is scanned again and starts another comment
+				pass
+			elif kind == 'UNTERMINATED_COMMENT':
+				pos = position.Position(text_len, src)
+				yield self.fail(errors.ExpectedCharError(pos, pos,
+				"Expected '/@'. Instead found the end of the file"))
+				return
+			else:
+				char = m.group()
+				if binary: char = char.decode('utf-8', 'replace')
+				if char != '!':
+					yield self.fail(errors.IllegalCharError(position.Position(idx, src), position.Position(end, src), "'" + char + "'"))
+					return
+
+				yield self.fail(errors.ExpectedCharError(position.Position(idx, src), position.Position(end + 1, src),
+				"Expected '=' after '!'"))
+				return
+
+			idx = end
+
+		yield token.Token(token.T_EOF, pos_start=position.Position(idx, src))
+
+	def fail(self, error):
+		# The stream still ends in EOF so a parser pulling from it stops cleanly
+		self.error = error
+		return token.Token(token.T_EOF, pos_start=error.pos_start)
+
+	def make_tokens_legacy(self):
 		tokens = []
 
 		while self.current_char != None:
@@ -53,7 +238,7 @@ class Lexer:
 				_, error = self.skip_comment()
 				if error: return [], error
 			elif self.current_char in ';\n':
-				tokens.append(token.Token(token.T_NEWLINE, pos_start=self.pos))
+				tokens.append(token.Token(token.T_NEWLINE, pos_start=self.pos.copy()))
 				self.advance()
 			elif self.current_char in DIGITS:
 				tokens.append(self.make_number())
@@ -62,47 +247,47 @@ class Lexer:
 			elif self.current_char == '"':
 				tokens.append(self.make_string())
 			elif self.current_char == '+':
-				tokens.append(token.Token(token.T_PLUS, pos_start=self.pos))
+				tokens.append(token.Token(token.T_PLUS, pos_start=self.pos.copy()))
 				self.advance()
 			elif self.current_char == '-':
 				tokens.append(self.make_minus_or_arrow())
 			elif self.current_char == '*':
-				tokens.append(token.Token(token.T_MUL, pos_start=self.pos))
+				tokens.append(token.Token(token.T_MUL, pos_start=self.pos.copy()))
 				self.advance()
 			elif self.current_char == '/':
 				tokens.append(self.make_divisions())
 			elif self.current_char == '%':
-				tokens.append(token.Token(token.T_REMAINDER, pos_start=self.pos))
+				tokens.append(token.Token(token.T_REMAINDER, pos_start=self.pos.copy()))
 				self.advance()
 			elif self.current_char == '^':
-				tokens.append(token.Token(token.T_POW, pos_start=self.pos))
+				tokens.append(token.Token(token.T_POW, pos_start=self.pos.copy()))
 				self.advance()
 			elif self.current_char == '(':
-				tokens.append(token.Token(token.T_LPAREN, pos_start=self.pos))
+				tokens.append(token.Token(token.T_LPAREN, pos_start=self.pos.copy()))
 				self.advance()
 			elif self.current_char == ')':
-				tokens.append(token.Token(token.T_RPAREN, pos_start=self.pos))
+				tokens.append(token.Token(token.T_RPAREN, pos_start=self.pos.copy()))
 				self.advance()
 			elif self.current_char == '[':
-				tokens.append(token.Token(token.T_LSQUARE, pos_start=self.pos))
+				tokens.append(token.Token(token.T_LSQUARE, pos_start=self.pos.copy()))
 				self.advance()
 			elif self.current_char == ']':
-				tokens.append(token.Token(token.T_RSQUARE, pos_start=self.pos))
+				tokens.append(token.Token(token.T_RSQUARE, pos_start=self.pos.copy()))
 				self.advance()
 			elif self.current_char == '{':
-				tokens.append(token.Token(token.T_LCURLY, pos_start=self.pos))
+				tokens.append(token.Token(token.T_LCURLY, pos_start=self.pos.copy()))
 				self.advance()
 			elif self.current_char == '}':
-				tokens.append(token.Token(token.T_RCURLY, pos_start=self.pos))
+				tokens.append(token.Token(token.T_RCURLY, pos_start=self.pos.copy()))
 				self.advance()
 			elif self.current_char == ':':
-				tokens.append(token.Token(token.T_COLON, pos_start=self.pos))
+				tokens.append(token.Token(token.T_COLON, pos_start=self.pos.copy()))
 				self.advance()
 			elif self.current_char == ',':
-				tokens.append(token.Token(token.T_COMMA, pos_start=self.pos))
+				tokens.append(token.Token(token.T_COMMA, pos_start=self.pos.copy()))
 				self.advance()
 			elif self.current_char == '.':
-				tokens.append(token.Token(token.T_DOT, pos_start=self.pos))
+				tokens.append(token.Token(token.T_DOT, pos_start=self.pos.copy()))
 				self.advance()
 			elif self.current_char == '!':
 				tok, error = self.make_not_equals()
@@ -120,7 +305,7 @@ class Lexer:
 				self.advance()
 				return [], errors.IllegalCharError(pos_start, self.pos, "'" + char + "'")
 
-		tokens.append(token.Token(token.T_EOF, pos_start=self.pos))
+		tokens.append(token.Token(token.T_EOF, pos_start=self.pos.copy()))
 		return tokens, None
 
 	def make_number(self):
@@ -138,9 +323,9 @@ class Lexer:
 			self.advance()
 
 		if dot_count == 0:
-			return token.Token(token.T_INT, int(num_str), pos_start, self.pos)
+			return token.Token(token.T_INT, int(num_str), pos_start, self.pos.copy())
 		else:
-			return token.Token(token.T_FLOAT, float(num_str), pos_start, self.pos)
+			return token.Token(token.T_FLOAT, float(num_str), pos_start, self.pos.copy())
 
 	def make_identifier(self):
 		id_str = ''
@@ -150,8 +335,9 @@ class Lexer:
 			id_str += self.current_char
 			self.advance()
 
+		id_str = sys.intern(id_str)
 		tok_type = token.T_KEYWORD if id_str in KEYWORDS else token.T_IDENTIFIER
-		return token.Token(tok_type, id_str, pos_start, self.pos)
+		return token.Token(tok_type, id_str, pos_start, self.pos.copy())
 
 	def make_string(self):
 		string = ''
@@ -176,7 +362,7 @@ class Lexer:
 			escape_character = False
 
 		self.advance()
-		return token.Token(token.T_STRING, string, pos_start, self.pos)
+		return token.Token(token.T_STRING, string, pos_start, self.pos.copy())
 
 
 	def make_not_equals(self):
@@ -185,7 +371,7 @@ class Lexer:
 
 		if self.current_char == '=':
 			self.advance()
-			return token.Token(token.T_NE, pos_start=pos_start, pos_end=self.pos), None
+			return token.Token(token.T_NE, pos_start=pos_start, pos_end=self.pos.copy()), None
 
 		self.advance()
 		return None, errors.ExpectedCharError(pos_start, self.pos,
@@ -200,7 +386,7 @@ class Lexer:
 			self.advance()
 			tok_type = token.T_EE
 
-		return token.Token(tok_type, pos_start=pos_start, pos_end=self.pos)
+		return token.Token(tok_type, pos_start=pos_start, pos_end=self.pos.copy())
 
 	def make_less_than(self):
 		tok_type = token.T_LT
@@ -211,7 +397,7 @@ class Lexer:
 			self.advance()
 			tok_type = token.T_LTE
 
-		return token.Token(tok_type, pos_start=pos_start, pos_end=self.pos)
+		return token.Token(tok_type, pos_start=pos_start, pos_end=self.pos.copy())
 
 	def make_greater_than(self):
 		tok_type = token.T_GT
@@ -222,7 +408,7 @@ class Lexer:
 			self.advance()
 			tok_type = token.T_GTE
 
-		return token.Token(tok_type, pos_start=pos_start, pos_end=self.pos)
+		return token.Token(tok_type, pos_start=pos_start, pos_end=self.pos.copy())
 
 	def make_divisions(self):
 		tok_type = token.T_DIV
@@ -233,7 +419,7 @@ class Lexer:
 			self.advance()
 			tok_type = token.T_INT_DIV
 
-		return token.Token(tok_type, pos_start=pos_start, pos_end=self.pos)
+		return token.Token(tok_type, pos_start=pos_start, pos_end=self.pos.copy())
 
 	def make_minus_or_arrow(self):
 		tok_type = token.T_MINUS
@@ -244,7 +430,7 @@ class Lexer:
 			self.advance()
 			tok_type = token.T_ARROW
 
-		return token.Token(tok_type, pos_start=pos_start, pos_end=self.pos)
+		return token.Token(tok_type, pos_start=pos_start, pos_end=self.pos.copy())
 
 	def skip_comment(self):
 		
@@ -1,6 +1,76 @@
 from lib.utils import token, nodes
 from lib import errors
 
+#######################################
+# OPERATORS
+#######################################
+
+PREC_LOGIC		= 1
+PREC_COMPARISON	= 2
+PREC_ARITH		= 3
+PREC_TERM		= 4
+PREC_POW		= 5
+
+# Binary operators keyed by token type, or by (type, value) for keywords,
+# mapped to (precedence, right associative)
+BINARY_OPERATORS = {
+	(token.T_KEYWORD, 'and'):	(PREC_LOGIC, False),
+	(token.T_KEYWORD, 'or'):	(PREC_LOGIC, False),
+	token.T_EE:					(PREC_COMPARISON, False),
+	token.T_NE:					(PREC_COMPARISON, False),
+	token.T_LT:					(PREC_COMPARISON, False),
+	token.T_GT:					(PREC_COMPARISON, False),
+	token.T_LTE:				(PREC_COMPARISON, False),
+	token.T_GTE:				(PREC_COMPARISON, False),
+	token.T_PLUS:				(PREC_ARITH, False),
+	token.T_MINUS:				(PREC_ARITH, False),
+	token.T_MUL:				(PREC_TERM, False),
+	token.T_DIV:				(PREC_TERM, False),
+	token.T_INT_DIV:			(PREC_TERM, False),
+	token.T_REMAINDER:			(PREC_TERM, False),
+	token.T_POW:				(PREC_POW, True),
+}
+
+# Tokens that can begin an expression or a statement. statements() and
+# 'return' decide with this single token of lookahead instead of trying a
+# parse and backtracking when it fails
+EXPR_START_TYPES = frozenset([
+	token.T_INT, token.T_FLOAT, token.T_STRING, token.T_IDENTIFIER,
+	token.T_LPAREN, token.T_LSQUARE, token.T_LCURLY, token.T_PLUS, token.T_MINUS,
+])
+EXPR_START_KEYWORDS = frozenset(['var', 'not', 'if', 'for', 'while', 'func'])
+STATEMENT_START_KEYWORDS = EXPR_START_KEYWORDS | frozenset(['return', 'continue', 'break'])
+
+# Names and literals are read without a rule of their own. Operands starting
+# with one of PREFIX_TYPES go through unary_expr
+SIMPLE_ATOM_TYPES = frozenset([token.T_INT, token.T_FLOAT, token.T_STRING, token.T_IDENTIFIER])
+PREFIX_TYPES = frozenset([token.T_PLUS, token.T_MINUS, token.T_KEYWORD])
+
+# Reported when an expression or a comparison is missing altogether
+EXPR_EXPECTED = "Expected int or float, identifier, 'var', 'if', 'for', 'while', 'func', '+', '-', '(' or '['"
+COMP_EXPR_EXPECTED = "Expected int or float, identifier, '+', '-', '(', '[' or 'not'"
+
+LOOP_NODES = (nodes.ForNode, nodes.ForEachNode, nodes.WhileNode)
+
+def discard_value(node):
+	# Nothing reads the value of a statement, so the loops that would give it
+	# are made to give null and do not collect their body's values. The
+	# branches of an if and the body of such a loop are passed over the same
+	# way; blocks were already handled as their statements were parsed
+	pending = [node]
+	while pending:
+		node = pending.pop()
+		if isinstance(node, nodes.ListNode):
+			pending.extend(node.element_nodes)
+		elif isinstance(node, LOOP_NODES):
+			if not node.should_return_null:
+				node.should_return_null = True
+				pending.append(node.body_node)
+		elif isinstance(node, nodes.IfNode):
+			pending.extend(expr for _, expr, should_return_null in node.cases if not should_return_null)
+			if node.else_case and not node.else_case[1]:
+				pending.append(node.else_case[0])
+
 #######################################
 # PARSE RESULT
 #######################################
@@ -9,26 +79,16 @@ class ParseResult:
 	def __init__(self):
 		self.error = None
 		self.node = None
-		self.last_registered_advance_count = 0
 		self.advanced_count = 0
-		self.to_reverse_count = 0
 
 	def register_advancement(self):
 		self.advanced_count += 1
-		self.last_registered_advance_count += 1
 
 	def register(self, res):
-		self.last_registered_advance_count = res.advanced_count
 		self.advanced_count += res.advanced_count
 		if res.error: self.error = res.error
 		return res.node
 
-	def try_register(self, res):
-		if res.error:
-			self.to_reverse_count = res.advanced_count
-			return None
-		return self.register(res)
-
 	def success(self, node):
 		self.node = node
 		return self
@@ -43,30 +103,38 @@ class ParseResult:
 #######################################
 
 class Parser:
-	def __init__(self, tokens):
-		self.tokens = tokens
-		self.tok_idx = -1
+	def __init__(self, tokens, statement_starts=None):
+		# Tokens may be a list or a stream from Lexer.generate_tokens. The parser
+		# never looks back, so only the current token is kept
+		self.tokens = iter(tokens)
+		self.current_tok = None
+		self.constants = {}
+		# When given a list, the offset of the first token of every top-level
+		# statement is added to it
+		self.statement_starts = statement_starts
 		self.advance()
 
 	def advance(self):
-		self.tok_idx += 1
-		self.update_current_tok()
+		tok = next(self.tokens, None)
+		if tok is not None: self.current_tok = tok
 		return self.current_tok
 
-	def reverse(self, amount=1):
-		self.tok_idx -= amount
-		self.update_current_tok()
-		return self.current_tok
+	def starts_expr(self):
+		tok = self.current_tok
+		if tok.type == token.T_KEYWORD: return tok.value in EXPR_START_KEYWORDS
+		return tok.type in EXPR_START_TYPES
 
-	def update_current_tok(self):
-		if self.tok_idx >= 0 and self.tok_idx < len(self.tokens):
-			self.current_tok = self.tokens[self.tok_idx]
+	def starts_statement(self):
+		tok = self.current_tok
+		if tok.type == token.T_KEYWORD: return tok.value in STATEMENT_START_KEYWORDS
+		return tok.type in EXPR_START_TYPES
 
 	def parse(self):
-		if len(self.tokens) == 1 and self.tokens[0].type == token.T_EOF:
-			return ParseResult().success(nodes.ListNode([], self.tokens[0].pos_start, self.tokens[0].pos_end))
+		if self.current_tok.type == token.T_EOF:
+			tok = self.current_tok
+			return ParseResult().success(nodes.ListNode([], tok.pos_start.idx, tok.pos_end.idx, tok.pos_start.src))
 
-		res = self.statements()
+		res = self.drive(self.statements(self.statement_starts))
 		if not res.error and self.current_tok.type != token.T_EOF:
 			return res.failure(errors.InvalidSyntaxError(
 				self.current_tok.pos_start, self.current_tok.pos_end,
@@ -74,69 +142,121 @@ class Parser:
 			))
 		return res
 
+	def parse_region(self):
+		# Top-level statements taken from the middle of a file. Each one must be
+		# followed by a new line, as the statement after the region will need
+		return self.drive(self.region_statements(self.statement_starts))
+
+	def drive(self, rule):
+		# Grammar rules are generators that yield the rules they depend on and
+		# receive their results back. Running them from this loop keeps nesting
+		# on a list instead of the call stack, so depth is only bounded by memory.
+		# A rule that needs no sub-rules may hand back its ParseResult directly
+		stack = []
+		result = None
+		while True:
+			try:
+				sub_rule = rule.send(result)
+			except StopIteration as done:
+				if not stack: return done.value
+				rule = stack.pop()
+				result = done.value
+				continue
+
+			if type(sub_rule) is ParseResult:
+				result = sub_rule
+				continue
+
+			stack.append(rule)
+			rule = sub_rule
+			result = None
+
 	###################################
 
-	def statements(self):
+	def statements(self, starts=None):
 		res = ParseResult()
 		statements = []
-		pos_start = self.current_tok.pos_start.copy()
+		pos_start = self.current_tok.pos_start
 
 		while self.current_tok.type == token.T_NEWLINE:
 			res.register_advancement()
 			self.advance()
 
-		statement = res.register(self.statement())
+		if starts is not None: starts.append(self.current_tok.pos_start.idx)
+		statement = res.register((yield self.statement()))
 		if res.error: return res
+		discard_value(statement)
 		statements.append(statement)
 
-		more_statements = True
-
-		while True:
-			newline_count = 0
+		while self.current_tok.type == token.T_NEWLINE:
 			while self.current_tok.type == token.T_NEWLINE:
 				res.register_advancement()
 				self.advance()
-				newline_count += 1
-			if newline_count == 0:
-				more_statements = False
-
-			if not more_statements: break
-			statement = res.try_register(self.statement())
-			if not statement:
-				self.reverse(res.to_reverse_count)
-				more_statements = False
-				continue
+
+			# Anything that cannot start a statement ends the block and is left
+			# for the caller ('end', 'else', '}', EOF...)
+			if not self.starts_statement(): break
+
+			if starts is not None: starts.append(self.current_tok.pos_start.idx)
+			statement = res.register((yield self.statement()))
+			if res.error: return res
+			discard_value(statement)
 			statements.append(statement)
 
 		return res.success(nodes.ListNode(
-			statements, pos_start, self.current_tok.pos_end.copy()
+			statements, pos_start.idx, self.current_tok.pos_end.idx, pos_start.src
 		))
 
+	def region_statements(self, starts):
+		res = ParseResult()
+		statements = []
+
+		while True:
+			while self.current_tok.type == token.T_NEWLINE:
+				res.register_advancement()
+				self.advance()
+
+			if self.current_tok.type == token.T_EOF:
+				return res.success(statements)
+
+			if starts is not None: starts.append(self.current_tok.pos_start.idx)
+			statement = res.register((yield self.statement()))
+			if res.error: return res
+			discard_value(statement)
+			statements.append(statement)
+
+			if self.current_tok.type != token.T_NEWLINE:
+				return res.failure(errors.InvalidSyntaxError(
+					self.current_tok.pos_start, self.current_tok.pos_end,
+					"Expected a new line"
+				))
+
 
 	def statement(self):
 		res = ParseResult()
-		pos_start = self.current_tok.pos_start.copy()
+		pos_start = self.current_tok.pos_start
 
 		if self.current_tok.matches(token.T_KEYWORD, 'return'):
 			res.register_advancement()
 			self.advance()
 
-			expr = res.try_register(self.expr())
-			if not expr:
-				self.reverse(res.to_reverse_count)
-			return res.success(nodes.ReturnNode(expr, pos_start, self.current_tok.pos_end.copy()))
+			expr = None
+			if self.starts_expr():
+				expr = res.register((yield self.expr()))
+				if res.error: return res
+			return res.success(nodes.ReturnNode(expr, pos_start.idx, self.current_tok.pos_end.idx, pos_start.src))
 
 		if self.current_tok.matches(token.T_KEYWORD, 'continue'):
 			res.register_advancement()
 			self.advance()
-			return res.success(nodes.ContinueNode(pos_start, self.current_tok.pos_end.copy()))
+			return res.success(nodes.ContinueNode(pos_start.idx, self.current_tok.pos_end.idx, pos_start.src))
 
 		if self.current_tok.matches(token.T_KEYWORD, 'break'):
 			res.register_advancement()
 			self.advance()
-			return res.success(nodes.BreakNode(pos_start, self.current_tok.pos_end.copy()))
+			return res.success(nodes.BreakNode(pos_start.idx, self.current_tok.pos_end.idx, pos_start.src))
 
-		expr = res.register(self.expr())
+		expr = res.register((yield self.expr()))
 		if res.error:
 			return res.failure(errors.InvalidSyntaxError(
 				self.current_tok.pos_start, self.current_tok.pos_end,
@@ -147,112 +267,121 @@ class Parser:
 
 
 	def call(self):
+		# Names and literals that are not called are read in place, without
+		# going through the rule stack
+		if self.current_tok.type in SIMPLE_ATOM_TYPES:
+			res = self.simple_atom()
+			if res.error or self.current_tok.type != token.T_LPAREN: return res
+			return self.call_args(res, res.node)
+		return self.compound_call()
+
+	def compound_call(self):
 		res = ParseResult()
-
-		atom = res.register(self.atom())
+		atom = res.register((yield self.atom()))
 		if res.error: return res
 
-		if self.current_tok.type == token.T_LPAREN:
+		if self.current_tok.type != token.T_LPAREN: return res.success(atom)
+		return (yield self.call_args(res, atom))
+
+	def call_args(self, res, atom):
+		res.register_advancement()
+		self.advance()
+		arg_nodes = []
+		optional_arg_name_nodes = []
+		optional_arg_value_nodes = []
+
+		if self.current_tok.type == token.T_RPAREN:
 			res.register_advancement()
 			self.advance()
-			arg_nodes = []
-			optional_arg_name_nodes = []
-			optional_arg_value_nodes = []
+		else:
+			arg_nodes.append(res.register((yield self.expr())))
+			if res.error:
+				return res.failure(errors.InvalidSyntaxError(
+					self.current_tok.pos_start, self.current_tok.pos_end,
+					"Expected ')', 'var', 'if', 'for', 'while', 'func', int, float, identifier, '+', '-', '(', '[' or 'not'"
+				))
 
-			if self.current_tok.type == token.T_RPAREN:
+			while self.current_tok.type == token.T_COMMA:
 				res.register_advancement()
 				self.advance()
-			else:
-				arg_nodes.append(res.register(self.expr()))
+
+				arg_nodes.append(res.register((yield self.expr())))
+				if res.error: return res
+
+			if self.current_tok.type == token.T_EQ:
+				ident = arg_nodes.pop(-1)
+				if type(ident) != nodes.VarAccessNode:
+					return res.failure(errors.InvalidSyntaxError(
+						self.current_tok.pos_start, self.current_tok.pos_end,
+						"Expected an identifier"
+					))
+
+				optional_arg_name_nodes.append(ident.var_name)
+
+				res.register_advancement()
+				self.advance()
+
+				optional_arg_value_nodes.append(res.register((yield self.expr())))
 				if res.error:
 					return res.failure(errors.InvalidSyntaxError(
 						self.current_tok.pos_start, self.current_tok.pos_end,
-						"Expected ')', 'var', 'if', 'for', 'while', 'func', int, float, identifier, '+', '-', '(', '[' or 'not'"
+						"Expected int, float, string or boolean"
 					))
 
 				while self.current_tok.type == token.T_COMMA:
 					res.register_advancement()
 					self.advance()
 
-					arg_nodes.append(res.register(self.expr()))
-					if res.error: return res
-
-				if self.current_tok.type == token.T_EQ:
-					ident = arg_nodes.pop(-1)
-					if type(ident) != nodes.VarAccessNode:
+					if self.current_tok.type != token.T_IDENTIFIER:
 						return res.failure(errors.InvalidSyntaxError(
 							self.current_tok.pos_start, self.current_tok.pos_end,
-							"Expected an identifier"
+							f"Expected identifier"
 						))
 
-					optional_arg_name_nodes.append(ident.var_name_tok)
-
+					optional_arg_name_nodes.append(self.current_tok.value)
 					res.register_advancement()
 					self.advance()
 
-					optional_arg_value_nodes.append(res.register(self.expr()))
-					if res.error:
+					if self.current_tok.type != token.T_EQ:
 						return res.failure(errors.InvalidSyntaxError(
 							self.current_tok.pos_start, self.current_tok.pos_end,
-							"Expected int, float, string or boolean"
+							f"Expected ="
 						))
 
-					while self.current_tok.type == token.T_COMMA:
-						res.register_advancement()
-						self.advance()
-
-						if self.current_tok.type != token.T_IDENTIFIER:
-							return res.failure(errors.InvalidSyntaxError(
-								self.current_tok.pos_start, self.current_tok.pos_end,
-								f"Expected identifier"
-							))
-
-						optional_arg_name_nodes.append(self.current_tok)
-						res.register_advancement()
-						self.advance()
-
-						if self.current_tok.type != token.T_EQ:
-							return res.failure(errors.InvalidSyntaxError(
-								self.current_tok.pos_start, self.current_tok.pos_end,
-								f"Expected ="
-							))
-
-						res.register_advancement()
-						self.advance()
-
-						value = res.register(self.atom())
-						if res.error: return res
+					res.register_advancement()
+					self.advance()
 
-						optional_arg_value_nodes.append(value)
+					value = res.register((yield self.atom()))
+					if res.error: return res
 
+					optional_arg_value_nodes.append(value)
 
-				if self.current_tok.type != token.T_RPAREN:
-					return res.failure(errors.InvalidSyntaxError(
-						self.current_tok.pos_start, self.current_tok.pos_end,
-						"Expected ',' or ')'"
-					))
 
-				res.register_advancement()
-				self.advance()
+			if self.current_tok.type != token.T_RPAREN:
+				return res.failure(errors.InvalidSyntaxError(
+					self.current_tok.pos_start, self.current_tok.pos_end,
+					"Expected ',' or ')'"
+				))
 
-				
-			return res.success(nodes.CallNode(atom, arg_nodes, optional_arg_name_nodes, optional_arg_value_nodes))
-		return res.success(atom)
+			res.register_advancement()
+			self.advance()
 
+			
+		return res.success(nodes.CallNode(atom, arg_nodes, optional_arg_name_nodes, optional_arg_value_nodes))
 
-	def atom(self):
+	def simple_atom(self):
 		res = ParseResult()
 		tok = self.current_tok
 
 		if tok.type in (token.T_INT, token.T_FLOAT):
 			res.register_advancement()
 			self.advance()
-			return res.success(nodes.NumberNode(tok))
+			return res.success(nodes.NumberNode(self.constant(tok.value), tok.pos_start.idx, tok.pos_end.idx, tok.pos_start.src))
 
-		elif tok.type in (token.T_STRING):
+		elif tok.type == token.T_STRING:
 			res.register_advancement()
 			self.advance()
-			return res.success(nodes.StringNode(tok))
+			return res.success(nodes.StringNode(self.constant(tok.value), tok.pos_start.idx, tok.pos_end.idx, tok.pos_start.src))
 
 		elif tok.type == token.T_IDENTIFIER:
 			module = None
@@ -274,12 +403,22 @@ class Parser:
 
 				res.register_advancement()
 				self.advance()
-			return res.success(nodes.VarAccessNode(identifier, module))
+			return res.success(nodes.VarAccessNode(
+				identifier.value, module.value if module else None,
+				(module or identifier).pos_start.idx, identifier.pos_end.idx, identifier.pos_start.src
+			))
 
-		elif tok.type == token.T_LPAREN:
+	def atom(self):
+		res = ParseResult()
+		tok = self.current_tok
+
+		if tok.type in SIMPLE_ATOM_TYPES:
+			return self.simple_atom()
+
+		if tok.type == token.T_LPAREN:
 			res.register_advancement()
 			self.advance()
-			expr = res.register(self.expr())
+			expr = res.register((yield self.expr()))
 			if res.error: return res
 			if self.current_tok.type == token.T_RPAREN:
 				res.register_advancement()
@@ -292,32 +431,32 @@ class Parser:
 				))
 
 		elif tok.type == token.T_LSQUARE:
-			list_expr = res.register(self.list_expr())
+			list_expr = res.register((yield self.list_expr()))
 			if res.error: return res
 			return res.success(list_expr)
 
 		elif tok.type == token.T_LCURLY:
-			dict_expr = res.register(self.dict_expr())
+			dict_expr = res.register((yield self.dict_expr()))
 			if res.error: return res
 			return res.success(dict_expr)
 
 		elif tok.matches(token.T_KEYWORD, 'if'):
-			if_expr = res.register(self.if_expr())
+			if_expr = res.register((yield self.if_expr()))
 			if res.error: return res
 			return res.success(if_expr)
 
 		elif tok.matches(token.T_KEYWORD, 'for'):
-			for_expr = res.register(self.for_expr())
+			for_expr = res.register((yield self.for_expr()))
 			if res.error: return res
 			return res.success(for_expr)
 
 		elif tok.matches(token.T_KEYWORD, 'while'):
-			while_expr = res.register(self.while_expr())
+			while_expr = res.register((yield self.while_expr()))
 			if res.error: return res
 			return res.success(while_expr)
 
 		elif tok.matches(token.T_KEYWORD, 'func'):
-			func_def = res.register(self.func_def())
+			func_def = res.register((yield self.func_def()))
 			if res.error: return res
 			return res.success(func_def)
 
@@ -326,13 +465,12 @@ class Parser:
 			"Expected int or float, identifier, '+', '-' or '(', , '[', 'if', 'for', 'while' or 'func'"
 		))
 
-	def power(self):
-		return self.bin_op(self.call, (token.T_POW, ), self.factor)
-
 	def dict_expr(self):
 		res = ParseResult()
 		element_nodes = {}
-		pos_start = self.current_tok.pos_start.copy()
+		# The first node seen for each key, so a repeated key overwrites its value
+		key_nodes = {}
+		pos_start = self.current_tok.pos_start
 
 		if self.current_tok.type != token.T_LCURLY:
 			return res.failure(errors.InvalidSyntaxError(
@@ -347,7 +485,7 @@ class Parser:
 			res.register_advancement()
 			self.advance()
 		else:
-			key = res.register(self.expr())
+			key = res.register((yield self.expr()))
 			if res.error:
 				return res.failure(errors.InvalidSyntaxError(
 					self.current_tok.pos_start, self.current_tok.pos_end,
@@ -369,21 +507,20 @@ class Parser:
 			res.register_advancement()
 			self.advance()
 
-			value = res.register(self.expr())
+			value = res.register((yield self.expr()))
 			if res.error:
 				return res.failure(errors.InvalidSyntaxError(
 					self.current_tok.pos_start, self.current_tok.pos_end,
 					"Expected 'var', 'if', 'for', 'while', 'func', int, float, identifier, '+', '-', '(', '[' or 'not'"
 				))
 
-			element_nodes[key] = value
+			element_nodes[key_nodes.setdefault(key.value, key)] = value
 
 			while self.current_tok.type == token.T_COMMA:
-				added = False
 				res.register_advancement()
 				self.advance()
 
-				key = res.register(self.expr())
+				key = res.register((yield self.expr()))
 				if res.error:
 					return res.failure(errors.InvalidSyntaxError(
 						self.current_tok.pos_start, self.current_tok.pos_end,
@@ -405,22 +542,14 @@ class Parser:
 				res.register_advancement()
 				self.advance()
 
-				value = res.register(self.expr())
+				value = res.register((yield self.expr()))
 				if res.error:
 					return res.failure(errors.InvalidSyntaxError(
 						self.current_tok.pos_start, self.current_tok.pos_end,
 						"Expected 'var', 'if', 'for', 'while', 'func', int, float, identifier, '+', '-', '(', '[' or 'not'"
 					))
 
-				for i in element_nodes:
-					if i.tok.value == key.tok.value:
-						added = True
-						element_nodes[i] = value
-				
-				if not added:
-					element_nodes[key] = value
-
-				added = False
+				element_nodes[key_nodes.setdefault(key.value, key)] = value
 
 			if self.current_tok.type != token.T_RCURLY:
 				return res.failure(errors.InvalidSyntaxError(
@@ -432,14 +561,14 @@ class Parser:
 			self.advance()
 
 		return res.success(nodes.DictNode(
-			element_nodes, pos_start, self.current_tok.pos_end.copy()
+			element_nodes, pos_start.idx, self.current_tok.pos_end.idx, pos_start.src
 		))
 		
 
 	def list_expr(self):
 		res = ParseResult()
 		element_nodes = []
-		pos_start = self.current_tok.pos_start.copy()
+		pos_start = self.current_tok.pos_start
 
 		if self.current_tok.type != token.T_LSQUARE:
 			return res.failure(errors.InvalidSyntaxError(
@@ -454,7 +583,7 @@ class Parser:
 			res.register_advancement()
 			self.advance()
 		else:
-			element_nodes.append(res.register(self.expr()))
+			element_nodes.append(res.register((yield self.expr())))
 			if res.error:
 				return res.failure(errors.InvalidSyntaxError(
 					self.current_tok.pos_start, self.current_tok.pos_end,
@@ -465,7 +594,7 @@ class Parser:
 				res.register_advancement()
 				self.advance()
 
-				element_nodes.append(res.register(self.expr()))
+				element_nodes.append(res.register((yield self.expr())))
 				if res.error: return res
 
 			if self.current_tok.type != token.T_RSQUARE:
@@ -477,94 +606,120 @@ class Parser:
 			res.register_advancement()
 			self.advance()
 		return res.success(nodes.ListNode(
-			element_nodes, pos_start, self.current_tok.pos_end.copy()
+			element_nodes, pos_start.idx, self.current_tok.pos_end.idx, pos_start.src
 		))
 
 
-	def factor(self):
+	def comp_expr(self):
+		return self.binary_expr(PREC_COMPARISON, COMP_EXPR_EXPECTED)
+
+	def unary_expr(self, min_prec):
 		res = ParseResult()
 		tok = self.current_tok
 
 		if tok.type in (token.T_PLUS, token.T_MINUS):
 			res.register_advancement()
 			self.advance()
-			factor = res.register(self.factor())
+			node = res.register((yield self.binary_expr(PREC_POW)))
 			if res.error: return res
-			return res.success(nodes.UnaryOpNode(tok, factor))
-
-		return self.power()
+			return res.success(nodes.UnaryOpNode(tok.type, node, tok.pos_start.idx))
 
-	def term(self):
-		return self.bin_op(self.factor, (token.T_MUL, token.T_DIV, token.T_INT_DIV, token.T_REMAINDER))
-
-	def arithm_expr(self):
-		return self.bin_op(self.term, (token.T_PLUS, token.T_MINUS))
-
-	def comp_expr(self):
-		res = ParseResult()
-
-		if self.current_tok.matches(token.T_KEYWORD, 'not'):
-			op_tok = self.current_tok
+		# 'not' negates a whole comparison, so it cannot start an arithmetic operand
+		if min_prec <= PREC_COMPARISON and tok.matches(token.T_KEYWORD, 'not'):
 			res.register_advancement()
 			self.advance()
-
-			node = res.register(self.comp_expr())
+			node = res.register((yield self.comp_expr()))
 			if res.error: return res
-			return res.success(nodes.UnaryOpNode(op_tok, node))
+			return res.success(nodes.UnaryOpNode(tok.value, node, tok.pos_start.idx))
 
-		node = res.register(self.bin_op(self.arithm_expr, (token.T_EE, token.T_NE, token.T_LT, token.T_GT, token.T_LTE, token.T_GTE)))
+		return (yield self.call())
 
-		if res.error:
-			return res.failure(errors.InvalidSyntaxError(
-				self.current_tok.pos_start, self.current_tok.pos_end,
-				"Expected int or float, identifier, '+', '-', '(', '[' or 'not'"
-			))
+	def binary_expr(self, min_prec, expected=None):
+		# Operators are folded with a stack of pending left operands, so a chain
+		# of operators is one rule however many precedence levels it climbs
+		res = ParseResult()
+		pending = []
 
-		return res.success(node)
+		while True:
+			if self.current_tok.type in PREFIX_TYPES:
+				operand = yield self.unary_expr(min_prec)
+			else:
+				operand = yield self.call()
+
+			# An operand that fails before reading anything is reported as the
+			# expression expected here. Operands of 'and' and 'or' are whole comparisons
+			if operand.error:
+				if not pending:
+					message = expected
+				elif pending[-1][1] in ('and', 'or'):
+					message = COMP_EXPR_EXPECTED
+				else:
+					message = None
+				if message:
+					operand.failure(errors.InvalidSyntaxError(
+						self.current_tok.pos_start, self.current_tok.pos_end, message
+					))
+			right = res.register(operand)
+			if res.error: return res
 
-	def expr(self):
-		res = ParseResult()
+			while True:
+				op_tok = self.current_tok
+				op = BINARY_OPERATORS.get(op_tok.type)
+				if op == None and op_tok.type == token.T_KEYWORD:
+					op = BINARY_OPERATORS.get((op_tok.type, op_tok.value))
+				if op != None and op[0] >= min_prec: break
+				if not pending: return res.success(right)
 
-		if self.current_tok.matches(token.T_KEYWORD, 'var'):
-			res.register_advancement()
-			self.advance()
-		
-			if self.current_tok.type != token.T_IDENTIFIER:
-				return res.failure(errors.InvalidSyntaxError(
-					self.current_tok.pos_start, self.current_tok.pos_end,
-					"Expected identifier"
-				))
+				left, op_value, min_prec = pending.pop()
+				right = nodes.BinOpNode(left, op_value, right)
 
-			var_name = self.current_tok
+			prec, right_assoc = op
 			res.register_advancement()
 			self.advance()
 
-			if self.current_tok.type != token.T_EQ:
-				return res.failure(errors.InvalidSyntaxError(
-					self.current_tok.pos_start, self.current_tok.pos_end,
-					"Expected '='"
-				))
+			pending.append((right, op_tok.value if op_tok.type == token.T_KEYWORD else op_tok.type, min_prec))
+			if prec == PREC_LOGIC:
+				min_prec = PREC_COMPARISON
+			else:
+				min_prec = prec if right_assoc else prec + 1
 
-			res.register_advancement()
-			self.advance()
-			expr = res.register(self.expr())
+	def expr(self):
+		if self.current_tok.matches(token.T_KEYWORD, 'var'):
+			return self.var_expr()
+		return self.binary_expr(PREC_LOGIC, EXPR_EXPECTED)
 
-			if res.error: return res
-			return res.success(nodes.VarAssignNode(var_name, expr))
+	def var_expr(self):
+		res = ParseResult()
+
+		res.register_advancement()
+		self.advance()
+		
+		if self.current_tok.type != token.T_IDENTIFIER:
+			return res.failure(errors.InvalidSyntaxError(
+				self.current_tok.pos_start, self.current_tok.pos_end,
+				"Expected identifier"
+			))
 
-		node = res.register(self.bin_op(self.comp_expr, ((token.T_KEYWORD, 'and'), (token.T_KEYWORD, 'or'))))
+		var_name = self.current_tok
+		res.register_advancement()
+		self.advance()
 
-		if res.error:
+		if self.current_tok.type != token.T_EQ:
 			return res.failure(errors.InvalidSyntaxError(
 				self.current_tok.pos_start, self.current_tok.pos_end,
-				"Expected int or float, identifier, 'var', 'if', 'for', 'while', 'func', '+', '-', '(' or '['"
+				"Expected '='"
 			))
 
-		return res.success(node)
+		res.register_advancement()
+		self.advance()
+		expr = res.register((yield self.expr()))
+
+		if res.error: return res
+		return res.success(nodes.VarAssignNode(var_name.value, expr, var_name.pos_start.idx))
 
 	def if_expr(self):
 		res = ParseResult()
-		all_cases = res.register(self.if_expr_cases('if'))
+		all_cases = res.register((yield self.if_expr_cases('if')))
 		if res.error: return res
 		cases, else_case = all_cases
 		return res.success(nodes.IfNode(cases, else_case))
@@ -583,7 +738,7 @@ class Parser:
 		res.register_advancement()
 		self.advance()
 
-		condition = res.register(self.expr())
+		condition = res.register((yield self.expr()))
 		if res.error: return res
 
 		if not self.current_tok.type == token.T_COLON:
@@ -599,7 +754,7 @@ class Parser:
 			res.register_advancement()
 			self.advance()
 
-			statements = res.register(self.statements())
+			statements = res.register((yield self.statements()))
 			if res.error: return res
 			cases.append((condition, statements, True))
 
@@ -607,16 +762,16 @@ class Parser:
 				res.register_advancement()
 				self.advance()
 			else:
-				all_cases = res.register(self.if_expr_b_or_c())
+				all_cases = res.register((yield self.if_expr_b_or_c()))
 				if res.error: return res
 				new_cases, else_case = all_cases
 				cases.extend(new_cases)
 		else:
-			expr = res.register(self.statement())
+			expr = res.register((yield self.statement()))
 			if res.error: return res
 			cases.append((condition, expr, False))
 
-			all_cases = res.register(self.if_expr_b_or_c())
+			all_cases = res.register((yield self.if_expr_b_or_c()))
 			if res.error: return res
 			new_cases, else_case = all_cases
 			cases.extend(new_cases)
@@ -624,7 +779,7 @@ class Parser:
 		return res.success((cases, else_case))
 
 	def if_expr_b(self):
-		return self.if_expr_cases('elif')
+		return (yield self.if_expr_cases('elif'))
     
 	def if_expr_c(self):
 		res = ParseResult()
@@ -647,7 +802,7 @@ class Parser:
 				res.register_advancement()
 				self.advance()
 
-				statements = res.register(self.statements())
+				statements = res.register((yield self.statements()))
 				if res.error: return res
 				else_case = (statements, True)
 
@@ -660,7 +815,7 @@ class Parser:
 						"Expected 'end'"
 					))
 			else:
-				expr = res.register(self.statement())
+				expr = res.register((yield self.statement()))
 				if res.error: return res
 				else_case = (expr, False)
 
@@ -671,11 +826,11 @@ class Parser:
 		cases, else_case = [], None
 
 		if self.current_tok.matches(token.T_KEYWORD, 'elif'):
-			all_cases = res.register(self.if_expr_b())
+			all_cases = res.register((yield self.if_expr_b()))
 			if res.error: return res
 			cases, else_case = all_cases
 		else:
-			else_case = res.register(self.if_expr_c())
+			else_case = res.register((yield self.if_expr_c()))
 			if res.error: return res
     
 		return res.success((cases, else_case))
@@ -707,7 +862,7 @@ class Parser:
 			res.register_advancement()
 			self.advance()
 
-			start_value = res.register(self.expr())
+			start_value = res.register((yield self.expr()))
 			if res.error: return res
 
 			if not self.current_tok.matches(token.T_KEYWORD, 'to'):
@@ -719,14 +874,14 @@ class Parser:
 			res.register_advancement()
 			self.advance()
 
-			end_value = res.register(self.expr())
+			end_value = res.register((yield self.expr()))
 			if res.error: return res
 
 			if self.current_tok.matches(token.T_KEYWORD, 'step'):
 				res.register_advancement()
 				self.advance()
 
-				step_value = res.register(self.expr())
+				step_value = res.register((yield self.expr()))
 				if res.error: return res
 			else:
 				step_value = None
@@ -744,7 +899,7 @@ class Parser:
 				res.register_advancement()
 				self.advance()
 
-				body = res.register(self.statements())
+				body = res.register((yield self.statements()))
 				if res.error: return res
 
 				if not self.current_tok.matches(token.T_KEYWORD, 'end'):
@@ -756,17 +911,17 @@ class Parser:
 				res.register_advancement()
 				self.advance()
 
-				return res.success(nodes.ForNode(var_name, start_value, end_value, step_value, body, True))
+				return res.success(nodes.ForNode(var_name.value, start_value, end_value, step_value, body, True, var_name.pos_start.idx))
 			
-			body = res.register(self.statement())
+			body = res.register((yield self.statement()))
 			if res.error: return res
 
-			return res.success(nodes.ForNode(var_name, start_value, end_value, step_value, body, False))
+			return res.success(nodes.ForNode(var_name.value, start_value, end_value, step_value, body, False, var_name.pos_start.idx))
 		elif self.current_tok.matches(token.T_KEYWORD, 'in'):
 			res.register_advancement()
 			self.advance()
 
-			array = res.register(self.expr())
+			array = res.register((yield self.expr()))
 			if res.error: return res
 
 			if not self.current_tok.type == token.T_COLON:
@@ -782,7 +937,7 @@ class Parser:
 				res.register_advancement()
 				self.advance()
 
-				body = res.register(self.statements())
+				body = res.register((yield self.statements()))
 				if res.error: return res
 
 				if not self.current_tok.matches(token.T_KEYWORD, 'end'):
@@ -794,12 +949,12 @@ class Parser:
 				res.register_advancement()
 				self.advance()
 
-				return res.success(nodes.ForEachNode(var_name, array, body, True))
+				return res.success(nodes.ForEachNode(var_name.value, array, body, True, var_name.pos_start.idx))
 			
-			body = res.register(self.statement())
+			body = res.register((yield self.statement()))
 			if res.error: return res
 
-			return res.success(nodes.ForNode(var_name, start_value, end_value, step_value, body, False))
+			return res.success(nodes.ForEachNode(var_name.value, array, body, False, var_name.pos_start.idx))
 		else:
 			return res.failure(errors.InvalidSyntaxError(
 				self.current_tok.pos_start, self.current_tok.pos_end,
@@ -819,7 +974,7 @@ class Parser:
 		res.register_advancement()
 		self.advance()
 
-		condition = res.register(self.expr())
+		condition = res.register((yield self.expr()))
 		if res.error: return res
 
 		if not self.current_tok.type == token.T_COLON:
@@ -835,7 +990,7 @@ class Parser:
 			res.register_advancement()
 			self.advance()
 
-			body = res.register(self.statements())
+			body = res.register((yield self.statements()))
 			if res.error: return res
 
 			if not self.current_tok.matches(token.T_KEYWORD, 'end'):
@@ -849,7 +1004,7 @@ class Parser:
 
 			return res.success(nodes.WhileNode(condition, body, True))
 		
-		body = res.register(self.statement())
+		body = res.register((yield self.statement()))
 		if res.error: return res
 
 		return res.success(nodes.WhileNode(condition, body, False))
@@ -913,7 +1068,7 @@ class Parser:
 				self.advance()
 				optional_arg_name_tokens.append(arg_name_toks.pop(-1))
 
-				value = res.register(self.atom())
+				value = res.register((yield self.atom()))
 				if res.error: return res
 
 				optional_arg_values_tokens.append(value)
@@ -941,7 +1096,7 @@ class Parser:
 					res.register_advancement()
 					self.advance()
 
-					value = res.register(self.atom())
+					value = res.register((yield self.atom()))
 					if res.error: return res
 
 					optional_arg_values_tokens.append(value)	
@@ -966,10 +1121,10 @@ class Parser:
 			res.register_advancement()
 			self.advance()
 
-			body = res.register(self.expr())
+			body = res.register((yield self.expr()))
 			if res.error: return res
 
-			return res.success(nodes.FunctionDefNode(
+			return res.success(self.func_def_node(
 				var_name_tok,
 				arg_name_toks,
 				optional_arg_name_tokens,
@@ -996,7 +1151,7 @@ class Parser:
 		res.register_advancement()
 		self.advance()
 
-		body = res.register(self.statements())
+		body = res.register((yield self.statements()))
 		if res.error: return res
 
 		if self.current_tok.type != token.T_RCURLY:
@@ -1008,7 +1163,7 @@ class Parser:
 		res.register_advancement()
 		self.advance()
 		
-		return res.success(nodes.FunctionDefNode(
+		return res.success(self.func_def_node(
 			var_name_tok,
 			arg_name_toks,
 			optional_arg_name_tokens,
@@ -1017,24 +1172,24 @@ class Parser:
 			False
 		))
 
+	def func_def_node(self, var_name_tok, arg_name_toks, optional_arg_name_toks, optional_arg_values, body, should_auto_return):
+		if var_name_tok:
+			start = var_name_tok.pos_start.idx
+		elif len(arg_name_toks) > 0:
+			start = arg_name_toks[0].pos_start.idx
+		else:
+			start = body.start
 
+		return nodes.FunctionDefNode(
+			var_name_tok.value if var_name_tok else None,
+			[tok.value for tok in arg_name_toks],
+			[tok.value for tok in optional_arg_name_toks],
+			optional_arg_values,
+			body,
+			should_auto_return,
+			start
+		)
 
-	###################################
-
-	def bin_op(self, func_a, ops, func_b=None):
-		if func_b == None:
-			func_b = func_a
-		
-		res = ParseResult()
-		left = res.register(func_a())
-		if res.error: return res
-
-		while self.current_tok.type in ops or (self.current_tok.type, self.current_tok.value) in ops:
-			op_tok = self.current_tok
-			res.register_advancement()
-			self.advance()
-			right = res.register(func_b())
-			if res.error: return res
-			left = nodes.BinOpNode(left, op_tok, right)
-
-		return res.success(left)
+	def constant(self, value):
+		# Repeated literals share one value object across the tree
+		return self.constants.setdefault((type(value), value), value)
@@ -0,0 +1,114 @@
+from lib.utils import nodes
+from lib import cache, lexer, parser
+import concurrent.futures
+import marshal
+import os
+
+#######################################
+# MODULE GRAPH
+#######################################
+
+# Before a program runs, the files it names in literal run("...") and
+# importAs("...", "...") calls are parsed in a pool of processes, along with
+# the files those name in turn. Finished trees are handed to the interpreter
+# through the cache, so execute_run finds them already parsed. Paths built at
+# run time are still parsed when they are reached
+
+IMPORT_FUNCTIONS = ('run', 'importAs')
+
+enabled = True
+
+def find_imports(node):
+	paths = []
+	for call in nodes.walk(node):
+		if not isinstance(call, nodes.CallNode) or not call.arg_nodes: continue
+
+		callee = call.node_to_call
+		path = call.arg_nodes[0]
+		if isinstance(callee, nodes.VarAccessNode) and callee.module_name is None \
+			and callee.var_name in IMPORT_FUNCTIONS \
+			and isinstance(path, nodes.StringNode) and path.value.endswith('.kode'):
+			paths.append(path.value)
+	return paths
+
+def parse_module(fn):
+	# Runs in a worker process. Gives the digest of the file, its tree in the
+	# cache's encoding and the files it imports, or None when the file cannot be
+	# read or parsed: the interpreter then reports the error when it gets there
+	try:
+		text = lexer.load_source(fn)
+	except OSError:
+		return None
+
+	lex = lexer.Lexer(fn, text)
+	res = parser.Parser(lex.generate_tokens()).parse()
+	if lex.error or res.error: return None
+
+	digest = cache.source_digest(text)
+	try:
+		body = marshal.dumps(cache.encode(res.node))
+	except (ValueError, RecursionError):
+		return None
+
+	cache.write_entry(fn, digest, body)
+	return digest, body, find_imports(res.node)
+
+def prefetch_imports(node):
+	# With a single core the pool only adds the cost of moving trees between
+	# processes
+	if not (enabled and cache.enabled) or (os.cpu_count() or 1) < 2: return
+
+	seen = set()
+	pending = []
+
+	def visit(paths):
+		for fn in paths:
+			path = os.path.abspath(fn)
+			if path in seen: continue
+			seen.add(path)
+
+			try:
+				text = lexer.load_source(fn)
+			except OSError:
+				continue
+
+			# Files with a valid cache entry are loaded here, only the rest are
+			# sent to the pool
+			tree = cache.load(fn, cache.source_digest(text), text)
+			if tree is None:
+				pending.append((fn, text))
+			else:
+				visit(find_imports(tree))
+
+	visit(find_imports(node))
+	if not pending: return
+
+	try:
+		pool = concurrent.futures.ProcessPoolExecutor()
+	except (OSError, NotImplementedError):
+		return
+
+	with pool:
+		jobs = {}
+		while pending or jobs:
+			for fn, text in pending:
+				jobs[pool.submit(parse_module, fn)] = (fn, text)
+			pending.clear()
+
+			done, _ = concurrent.futures.wait(jobs, return_when=concurrent.futures.FIRST_COMPLETED)
+			for job in done:
+				fn, text = jobs.pop(job)
+				try:
+					result = job.result()
+				except Exception:
+					# A worker that died only loses its file
+					continue
+				if result is None: continue
+
+				# The file may have changed since the worker read it
+				digest, body, paths = result
+				if digest != cache.source_digest(text): continue
+
+				tree = cache.load_body(body, fn, text)
+				cache.loaded[os.path.abspath(fn)] = (digest, tree)
+				visit(paths)
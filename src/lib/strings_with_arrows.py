@@ -1,26 +1,26 @@
-def string_with_arrows(text, pos_start, pos_end):
+def string_with_arrows(src, pos_start, pos_end):
     result = ''
 
-    # Calculate indices
-    idx_start = max(text.rfind('\n', 0, pos_start.idx), 0)
-    idx_end = text.find('\n', idx_start + 1)
-    if idx_end < 0: idx_end = len(text)
-    
+    # Resolve line and column only for the two ends of the span
+    ln_start, col_start = src.line_col(pos_start.idx)
+    if pos_end.idx > pos_start.idx:
+        ln_end, col_end = src.end_line_col(pos_end.idx)
+    else:
+        ln_end, col_end = ln_start, col_start
+
     # Generate each line
-    line_count = pos_end.ln - pos_start.ln + 1
+    line_count = ln_end - ln_start + 1
     for i in range(line_count):
+        ln = ln_start + i
+        line = src.line(ln)
+        if ln > 0: line = '\n' + line
+
         # Calculate line columns
-        line = text[idx_start:idx_end]
-        col_start = pos_start.col if i == 0 else 0
-        col_end = pos_end.col if i == line_count - 1 else len(line) - 1
+        col_first = col_start if i == 0 else 0
+        col_last = col_end if i == line_count - 1 else len(line) - 1
 
         # Append to result
         result += line + '\n'
-        result += ' ' * col_start + '^' * (col_end - col_start)
-
-        # Re-calculate indices
-        idx_start = idx_end
-        idx_end = text.find('\n', idx_start + 1)
-        if idx_end < 0: idx_end = len(text)
+        result += ' ' * col_first + '^' * (col_last - col_first)
 
-    return result.replace('\t', '')
\ No newline at end of file
+    return result.replace('\t', '')
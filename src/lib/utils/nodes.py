@@ -1,168 +1,277 @@
+from lib.utils import position
+
 #######################################
 # NODES
 #######################################
 
-class NumberNode:
-	def __init__(self, tok):
-		self.tok = tok
-
-		self.pos_start = self.tok.pos_start
-		self.pos_end = self.tok.pos_end
+# Nodes keep their source span as two offsets into src. Position objects are
+# only built, and then kept, for nodes that are evaluated or reported on
+
+class Node:
+	__slots__ = ('start', 'end', 'src', '_pos_start', '_pos_end', '_code', '_bytecode', '_tail', '_unseen')
+
+	def relocate(self, delta, src):
+		# Move the node into another version of its source, delta characters on
+		self.start += delta
+		self.end += delta
+		self.src = src
+		if hasattr(self, '_pos_start'): del self._pos_start
+		if hasattr(self, '_pos_end'): del self._pos_end
+		# Compiled code holds on to the old positions
+		if hasattr(self, '_code'): del self._code
+		if hasattr(self, '_bytecode'): del self._bytecode
+
+	@property
+	def pos_start(self):
+		try:
+			return self._pos_start
+		except AttributeError:
+			self._pos_start = position.Position(self.start, self.src)
+			return self._pos_start
+
+	@property
+	def pos_end(self):
+		try:
+			return self._pos_end
+		except AttributeError:
+			self._pos_end = position.Position(self.end, self.src)
+			return self._pos_end
+
+class NumberNode(Node):
+	__slots__ = ('value',)
+
+	def __init__(self, value, start, end, src):
+		self.value = value
+
+		self.start = start
+		self.end = end
+		self.src = src
 
 	def __repr__(self):
-		return f'{self.tok}'
+		return f'{self.value}'
+
+class StringNode(Node):
+	__slots__ = ('value',)
 
-class StringNode:
-	def __init__(self, tok):
-		self.tok = tok
+	def __init__(self, value, start, end, src):
+		self.value = value
 
-		self.pos_start = self.tok.pos_start
-		self.pos_end = self.tok.pos_end
+		self.start = start
+		self.end = end
+		self.src = src
 
 	def __repr__(self):
-		return f'{self.tok}'
+		return f'{self.value}'
 
-class ListNode:
-	def __init__(self, element_nodes, pos_start, pos_end):
+class ListNode(Node):
+	__slots__ = ('element_nodes',)
+
+	def __init__(self, element_nodes, start, end, src):
 		self.element_nodes = element_nodes
 
-		self.pos_start = pos_start
-		self.pos_end = pos_end
+		self.start = start
+		self.end = end
+		self.src = src
+
+class DictNode(Node):
+	__slots__ = ('element_nodes',)
 
-class DictNode:
-	def __init__(self, element_nodes, pos_start, pos_end):
+	def __init__(self, element_nodes, start, end, src):
 		self.element_nodes = element_nodes
 
-		self.pos_start = pos_start
-		self.pos_end = pos_end
+		self.start = start
+		self.end = end
+		self.src = src
 
-class VarAccessNode:
-	def __init__(self, var_name_tok, module_tok):
-		self.var_name_tok = var_name_tok
-		self.module_tok = module_tok
+class VarAccessNode(Node):
+	__slots__ = ('var_name', 'module_name')
 
-		self.pos_start = self.var_name_tok.pos_start
-		if module_tok:
-			self.pos_start = self.module_tok.pos_start
-		self.pos_end = self.var_name_tok.pos_end
+	def __init__(self, var_name, module_name, start, end, src):
+		self.var_name = var_name
+		self.module_name = module_name
 
-class VarAssignNode:
-	def __init__(self, var_name_tok, value_node):
-		self.var_name_tok = var_name_tok
+		self.start = start
+		self.end = end
+		self.src = src
+
+class VarAssignNode(Node):
+	__slots__ = ('var_name', 'value_node')
+
+	def __init__(self, var_name, value_node, start):
+		self.var_name = var_name
 		self.value_node = value_node
 
-		self.pos_start = self.var_name_tok.pos_start
-		self.pos_end = self.value_node.pos_end
+		self.start = start
+		self.end = value_node.end
+		self.src = value_node.src
 
-class BinOpNode:
-	def __init__(self, left_node, op_tok, right_node):
+class BinOpNode(Node):
+	# op is the operator's token type, or the keyword itself for 'and' and 'or'
+	__slots__ = ('left_node', 'op', 'right_node')
+
+	def __init__(self, left_node, op, right_node):
 		self.left_node = left_node
-		self.op_tok = op_tok
+		self.op = op
 		self.right_node = right_node
 
-		self.pos_start = self.left_node.pos_start
-		self.pos_end = self.right_node.pos_end
+		self.start = left_node.start
+		self.end = right_node.end
+		self.src = left_node.src
 
 	def __repr__(self):
-		return f'({self.left_node}, {self.op_tok}, {self.right_node})'
+		return f'({self.left_node}, {self.op}, {self.right_node})'
+
+class UnaryOpNode(Node):
+	__slots__ = ('op', 'node')
 
-class UnaryOpNode:
-	def __init__(self, op_tok, node):
-		self.op_tok = op_tok
+	def __init__(self, op, node, start):
+		self.op = op
 		self.node = node
 
-		self.pos_start = self.op_tok.pos_start
-		self.pos_end = node.pos_end
+		self.start = start
+		self.end = node.end
+		self.src = node.src
 
 	def __repr__(self):
-		return f'({self.op_tok}, {self.node})'
+		return f'({self.op}, {self.node})'
+
+class IfNode(Node):
+	__slots__ = ('cases', 'else_case')
 
-class IfNode:
 	def __init__(self, cases, else_case):
 		self.cases = cases
 		self.else_case = else_case
 
-		self.pos_start = self.cases[0][0].pos_start
-		self.pos_end = (self.else_case or self.cases[len(self.cases)-1])[0].pos_end
+		self.start = cases[0][0].start
+		self.end = (else_case or cases[len(cases)-1])[0].end
+		self.src = cases[0][0].src
+
+class ForNode(Node):
+	__slots__ = ('var_name', 'start_value_node', 'end_value_node', 'step_value_node', 'body_node', 'should_return_null')
 
-class ForNode:
-	def __init__(self, var_name_tok, start_value_node, end_value_node, step_value_node, body_node, should_return_null):
-		self.var_name_tok = var_name_tok
+	def __init__(self, var_name, start_value_node, end_value_node, step_value_node, body_node, should_return_null, start):
+		self.var_name = var_name
 		self.start_value_node = start_value_node
 		self.end_value_node = end_value_node
 		self.step_value_node = step_value_node
 		self.body_node = body_node
 		self.should_return_null = should_return_null
 
-		self.pos_start = self.var_name_tok.pos_start
-		self.pos_end = self.body_node.pos_end
+		self.start = start
+		self.end = body_node.end
+		self.src = body_node.src
+
+class ForEachNode(Node):
+	__slots__ = ('var_name', 'array', 'body_node', 'should_return_null')
 
-class ForEachNode:
-	def __init__(self, var_name_tok, array, body_node, should_return_null):
-		self.var_name_tok = var_name_tok
+	def __init__(self, var_name, array, body_node, should_return_null, start):
+		self.var_name = var_name
 		self.array = array
 		self.body_node = body_node
 		self.should_return_null = should_return_null
 
-		self.pos_start = self.var_name_tok.pos_start
-		self.pos_end = self.body_node.pos_end
+		self.start = start
+		self.end = body_node.end
+		self.src = body_node.src
+
+class WhileNode(Node):
+	__slots__ = ('condition_node', 'body_node', 'should_return_null')
 
-class WhileNode:
 	def __init__(self, condition_node, body_node, should_return_null):
 		self.condition_node = condition_node
 		self.body_node = body_node
 		self.should_return_null = should_return_null
 
-		self.pos_start = self.condition_node.pos_start
-		self.pos_end = self.body_node.pos_end
+		self.start = condition_node.start
+		self.end = body_node.end
+		self.src = body_node.src
+
+class FunctionDefNode(Node):
+	__slots__ = ('var_name', 'arg_names', 'optional_arg_names', 'optional_arg_values', 'body_node', 'should_auto_return', 'module')
 
-class FunctionDefNode:
-	def __init__(self, var_name_tok, arg_name_toks, optional_arg_names, optional_arg_values, body_node, should_auto_return, module = None):
-		self.var_name_tok = var_name_tok
-		self.arg_name_toks = arg_name_toks
+	def __init__(self, var_name, arg_names, optional_arg_names, optional_arg_values, body_node, should_auto_return, start, module = None):
+		self.var_name = var_name
+		self.arg_names = arg_names
 		self.body_node = body_node
 		self.should_auto_return = should_auto_return
 		self.module = module
 		self.optional_arg_names = optional_arg_names
 		self.optional_arg_values = optional_arg_values
 
-		if self.var_name_tok:
-			self.pos_start = self.var_name_tok.pos_start
-		elif len(self.arg_name_toks)> 0:
-			self.pos_start = self.arg_name_toks[0].pos_start
-		else:
-			self.pos_start = self.body_node.pos_start
+		self.start = start
+		self.end = body_node.end
+		self.src = body_node.src
 
-		self.pos_end = self.body_node.pos_end
+class CallNode(Node):
+	__slots__ = ('node_to_call', 'arg_nodes', 'optional_arg_names', 'optional_arg_values')
 
-class CallNode:
 	def __init__(self, node_to_call, arg_nodes, optional_arg_names, optional_arg_values):
 		self.node_to_call = node_to_call
 		self.arg_nodes = arg_nodes
 		self.optional_arg_names = optional_arg_names
 		self.optional_arg_values = optional_arg_values
 
-		self.pos_start = self.node_to_call.pos_start
+		self.start = node_to_call.start
+		self.src = node_to_call.src
 
 		if len(arg_nodes) > 0:
-			self.pos_end = self.arg_nodes[len(self.arg_nodes)-1].pos_end
+			self.end = arg_nodes[len(arg_nodes)-1].end
 		else:
-			self.pos_end = self.node_to_call.pos_end
-
-class ReturnNode:
-	def __init__(self, node_to_return, pos_start, pos_end):
-		self.node_to_return = node_to_return
-		self.pos_start = pos_start
-		self.pos_end = pos_end
+			self.end = node_to_call.end
 
-class BreakNode:
-	def __init__(self, pos_start, pos_end):
-		self.pos_start = pos_start
-		self.pos_end = pos_end
+class ReturnNode(Node):
+	__slots__ = ('node_to_return',)
 
-class ContinueNode:
-	def __init__(self, pos_start, pos_end):
-		self.pos_start = pos_start
-		self.pos_end = pos_end
+	def __init__(self, node_to_return, start, end, src):
+		self.node_to_return = node_to_return
 
-			
\ No newline at end of file
+		self.start = start
+		self.end = end
+		self.src = src
+
+class BreakNode(Node):
+	__slots__ = ()
+
+	def __init__(self, start, end, src):
+		self.start = start
+		self.end = end
+		self.src = src
+
+class ContinueNode(Node):
+	__slots__ = ()
+
+	def __init__(self, start, end, src):
+		self.start = start
+		self.end = end
+		self.src = src
+
+def walk(node, leaves=()):
+	# Every node in the tree under node, without recursing. Nodes of the types
+	# in leaves are given but not entered
+	stack = [node]
+	while stack:
+		value = stack.pop()
+		if isinstance(value, Node):
+			yield value
+			if isinstance(value, leaves): continue
+			stack.extend(getattr(value, name) for name in type(value).__slots__)
+		elif isinstance(value, (list, tuple)):
+			stack.extend(value)
+		elif isinstance(value, dict):
+			stack.extend(value)
+			stack.extend(value.values())
+
+def loop_variable_unseen(node):
+	# Whether nothing a for loop's body runs can read or set the loop's
+	# variable: no node in it names the variable and it makes no call. Such a
+	# loop only has to store the last value it counted, however it ends. Found
+	# once per loop
+	try:
+		return node._unseen
+	except AttributeError:
+		var_name = node.var_name
+		node._unseen = not any(
+			isinstance(child, CallNode) or getattr(child, 'var_name', None) == var_name
+			for child in walk(node.body_node)
+		)
+		return node._unseen
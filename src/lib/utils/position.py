@@ -1,24 +1,157 @@
+import bisect
+import re
+
+#######################################
+# SOURCE
+#######################################
+
+class Source:
+	def __init__(self, fn, text):
+		self.fn = fn
+		self.text = text
+		self.line_starts = None
+
+	def update(self, text):
+		# The same file after an edit: lines are located again when needed
+		self.text = text
+		self.line_starts = None
+
+	def get_line_starts(self):
+		if self.line_starts is None:
+			text = self.text
+			line_starts = [0]
+			idx = text.find('\n')
+			while idx >= 0:
+				line_starts.append(idx + 1)
+				idx = text.find('\n', idx + 1)
+			self.line_starts = line_starts
+		return self.line_starts
+
+	def line_col(self, idx):
+		line_starts = self.get_line_starts()
+		ln = bisect.bisect_right(line_starts, idx) - 1
+		return ln, idx - line_starts[ln]
+
+	def end_line_col(self, idx):
+		# An end position just past a newline belongs to the line it closes
+		if 0 < idx <= len(self.text) and self.text[idx - 1] == '\n':
+			ln, col = self.line_col(idx - 1)
+			return ln, col + 1
+		return self.line_col(idx)
+
+	def line(self, ln):
+		line_starts = self.get_line_starts()
+		if ln >= len(line_starts):
+			return ''
+		start = line_starts[ln]
+		end = line_starts[ln + 1] - 1 if ln + 1 < len(line_starts) else len(self.text)
+		return self.text[start:end]
+
+class MappedSource(Source):
+	# Backed by a bytes-like buffer such as an mmap. Nothing is decoded up
+	# front: error rendering locates and decodes just the lines it shows.
+	# Lines end where the lexer's new lines do, at CRLF, LF or a lone CR
+	CHUNK_SIZE = 1 << 20
+	LINE_BREAK = re.compile(rb'\r\n?|\n')
+
+	def __init__(self, fn, buffer):
+		self.fn = fn
+		self.text = buffer
+		self.known_lines = {}
+
+	def update(self, text):
+		self.text = text
+		self.known_lines = {}
+
+	def count_newlines(self, end):
+		text = self.text
+		count = 0
+		for start in range(0, end, self.CHUNK_SIZE):
+			stop = min(end, start + self.CHUNK_SIZE)
+			chunk = text[start:stop]
+			count += chunk.count(b'\n') + chunk.count(b'\r') - chunk.count(b'\r\n')
+			# A CRLF split between two chunks is one line break
+			if stop < end and chunk.endswith(b'\r') and text[stop:stop + 1] == b'\n':
+				count -= 1
+		return count
+
+	def line_start(self, idx):
+		# A position between the CR and LF of a line break is still on its line
+		if idx > 0 and self.text[idx - 1:idx + 1] == b'\r\n': idx -= 1
+		return max(self.text.rfind(b'\n', 0, idx), self.text.rfind(b'\r', 0, idx)) + 1
+
+	def line_col(self, idx):
+		start = self.line_start(max(idx, 0))
+		ln = self.count_newlines(start)
+		self.known_lines[ln] = start
+
+		# Positions past the end of the buffer keep counting columns
+		end = min(idx, len(self.text))
+		return ln, len(self.text[start:end].decode('utf-8', 'replace')) + idx - end
+
+	def end_line_col(self, idx):
+		# A CRLF counts as the one character it was read as
+		if 0 < idx <= len(self.text) and self.text[idx - 1:idx] in (b'\n', b'\r'):
+			if idx > 1 and self.text[idx - 2:idx] == b'\r\n': idx -= 1
+			ln, col = self.line_col(idx - 1)
+			return ln, col + 1
+		return self.line_col(idx)
+
+	def line(self, ln):
+		start = self.known_lines.get(ln)
+		if start is None:
+			# Walk forward from the closest line already located
+			known = max((n for n in self.known_lines if n < ln), default=None)
+			if known is None:
+				known, start = 0, 0
+			else:
+				start = self.known_lines[known]
+			while known < ln:
+				line_break = self.LINE_BREAK.search(self.text, start)
+				if line_break is None: return ''
+				start = line_break.end()
+				known += 1
+			self.known_lines[ln] = start
+
+		line_break = self.LINE_BREAK.search(self.text, start)
+		end = line_break.start() if line_break else len(self.text)
+		return self.text[start:end].decode('utf-8', 'replace')
+
+def make_source(fn, text):
+	if isinstance(text, str):
+		return Source(fn, text)
+	return MappedSource(fn, text)
+
 #######################################
 # POSITION
 #######################################
 
 class Position:
-	def __init__(self, idx, ln, col, fn, ftxt):
+	__slots__ = ('idx', 'src')
+
+	def __init__(self, idx, src):
 		self.idx = idx
-		self.ln = ln
-		self.col = col
-		self.fn = fn
-		self.ftxt = ftxt
+		self.src = src
 
-	def advance(self, current_char=None):
-		self.idx += 1
-		self.col += 1
+	@property
+	def ln(self):
+		return self.src.line_col(self.idx)[0]
+
+	@property
+	def col(self):
+		return self.src.line_col(self.idx)[1]
 
-		if current_char == '\n':
-			self.ln += 1
-			self.col = 0
+	@property
+	def fn(self):
+		return self.src.fn
 
+	@property
+	def ftxt(self):
+		return self.src.text
+
+	def advance(self, current_char=None):
+		self.idx += 1
 		return self
 
 	def copy(self):
-		return Position(self.idx, self.ln, self.col, self.fn, self.ftxt)
\ No newline at end of file
+		return Position(self.idx, self.src)
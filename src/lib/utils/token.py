@@ -1,55 +1,90 @@
+from lib.utils import position
+
 #######################################
 # TOKENS
 #######################################
 
-T_INT	   		= 'INT'
-T_FLOAT    		= 'FLOAT'
-T_STRING		= 'STRING'
-T_IDENTIFIER	= 'IDENTIFIER'
-T_KEYWORD 		= 'KEYWORD'
-T_PLUS     		= 'PLUS'
-T_MINUS    		= 'MINUS'
-T_MUL      		= 'MUL'
-T_DIV      		= 'DIV'
-T_INT_DIV		= 'INT_DIV'
-T_REMAINDER		= 'REMAINDER'
-T_POW	   		= 'POW'
-T_EQ			= 'EQ'
-T_LPAREN   		= 'LPAREN'
-T_RPAREN   		= 'RPAREN'
-T_LSQUARE		= 'LSQUARE'
-T_RSQUARE		= 'RSQUARE'
-T_LCURLY		= 'LCURLY'
-T_RCURLY		= 'RCURLY'
-T_EE			= 'EE'
-T_NE 			= 'NE'
-T_GT			= 'GT'
-T_LT 			= 'LT'
-T_GTE			= 'GTE'
-T_LTE			= 'LTE'
-T_COMMA			= 'COMMA'
-T_COLON			= 'COLON'
-T_ARROW			= 'ARROW'
-T_DOT			= 'DOT'
-T_NEWLINE		= 'NEWLINE'
-T_EOF	   		= 'EOF'
+T_INT	   		= 0
+T_FLOAT    		= 1
+T_STRING		= 2
+T_IDENTIFIER	= 3
+T_KEYWORD 		= 4
+T_PLUS     		= 5
+T_MINUS    		= 6
+T_MUL      		= 7
+T_DIV      		= 8
+T_INT_DIV		= 9
+T_REMAINDER		= 10
+T_POW	   		= 11
+T_EQ			= 12
+T_LPAREN   		= 13
+T_RPAREN   		= 14
+T_LSQUARE		= 15
+T_RSQUARE		= 16
+T_LCURLY		= 17
+T_RCURLY		= 18
+T_EE			= 19
+T_NE 			= 20
+T_GT			= 21
+T_LT 			= 22
+T_GTE			= 23
+T_LTE			= 24
+T_COMMA			= 25
+T_COLON			= 26
+T_ARROW			= 27
+T_DOT			= 28
+T_NEWLINE		= 29
+T_EOF	   		= 30
+
+TOKEN_NAMES = {
+	T_INT:			'INT',
+	T_FLOAT:		'FLOAT',
+	T_STRING:		'STRING',
+	T_IDENTIFIER:	'IDENTIFIER',
+	T_KEYWORD:		'KEYWORD',
+	T_PLUS:			'PLUS',
+	T_MINUS:		'MINUS',
+	T_MUL:			'MUL',
+	T_DIV:			'DIV',
+	T_INT_DIV:		'INT_DIV',
+	T_REMAINDER:	'REMAINDER',
+	T_POW:			'POW',
+	T_EQ:			'EQ',
+	T_LPAREN:		'LPAREN',
+	T_RPAREN:		'RPAREN',
+	T_LSQUARE:		'LSQUARE',
+	T_RSQUARE:		'RSQUARE',
+	T_LCURLY:		'LCURLY',
+	T_RCURLY:		'RCURLY',
+	T_EE:			'EE',
+	T_NE:			'NE',
+	T_GT:			'GT',
+	T_LT:			'LT',
+	T_GTE:			'GTE',
+	T_LTE:			'LTE',
+	T_COMMA:		'COMMA',
+	T_COLON:		'COLON',
+	T_ARROW:		'ARROW',
+	T_DOT:			'DOT',
+	T_NEWLINE:		'NEWLINE',
+	T_EOF:			'EOF',
+}
 
 class Token:
+	__slots__ = ('type', 'value', 'pos_start', 'pos_end')
+
 	def __init__(self, type_, value=None, pos_start=None, pos_end=None):
 		self.type = type_
 		self.value = value
+		self.pos_start = pos_start
+		self.pos_end = pos_end
 
-		if pos_start:
-			self.pos_start = pos_start.copy()
-			self.pos_end = pos_start.copy()
-			self.pos_end.advance()
-
-		if pos_end:
-			self.pos_end = pos_end
+		if pos_start and not pos_end:
+			self.pos_end = position.Position(pos_start.idx + 1, pos_start.src)
 	
 	def __repr__(self):
-		if self.value: return f'{self.type}:{self.value}'
-		return f'{self.type}'
+		if self.value: return f'{TOKEN_NAMES[self.type]}:{self.value}'
+		return f'{TOKEN_NAMES[self.type]}'
 
 	def matches(self, type_, value):
 		return self.type == type_ and self.value == value
\ No newline at end of file